@@ -0,0 +1,277 @@
+"""
+Benchmarks for the VM manager internals.
+
+Usage:
+    python benchmark.py storage [--duration SECONDS]
+    python benchmark.py tokens [--iterations N]
+    python benchmark.py monitor-tick [--ticks N] [--latency SECONDS]
+    python benchmark.py outage [--outage SECONDS] [--interval SECONDS] [--reset-timeout SECONDS]
+    python benchmark.py time-to-sshx [--interval SECONDS] [--latency SECONDS]
+    python benchmark.py fleet [--targets N [N ...]] [--workers N] [--latency SECONDS]
+
+The monitor benchmarks run offline against fake_github.FakeGitHub.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+from fake_github import FakeGitHub
+from github import open_http_client, close_http_client, circuit_breaker
+from monitor import Monitor
+from storage import Storage
+
+
+async def _storage_workload(storage: Storage, duration: float):
+    """
+    Simulate a busy monitor plus an active dashboard.
+    The monitor ticks 10 times per second (uptime, run id, SSHX URL) and the
+    dashboard changes settings 5 times per second.
+    """
+    async def monitor():
+        tick = 0
+        while True:
+            storage.increment_uptime(60)
+            storage.set_last_run_id(1000 + tick)
+            storage.add_sshx_url(f"https://sshx.io/s/bench{tick % 50}")
+            tick += 1
+            await asyncio.sleep(0.1)
+    
+    async def dashboard():
+        while True:
+            storage.set_active_repo("bench/repo")
+            await asyncio.sleep(0.2)
+    
+    tasks = [asyncio.create_task(monitor()), asyncio.create_task(dashboard())]
+    flusher = asyncio.create_task(storage.run_flusher())
+    await asyncio.sleep(duration)
+    for task in tasks + [flusher]:
+        task.cancel()
+    await asyncio.gather(*tasks, flusher, return_exceptions=True)
+    storage.flush()
+
+
+def bench_storage(duration: float):
+    """Compare state file writes per minute: synchronous vs write-behind"""
+    print(f"Storage persistence ({duration:.0f}s busy monitor + dashboard)")
+    for label, interval in [("synchronous", 0), ("write-behind 1s", 1.0), ("write-behind 5s", 5.0)]:
+        with tempfile.TemporaryDirectory() as tmp:
+            storage = Storage(os.path.join(tmp, "state.json"), flush_interval=interval)
+            storage.write_count = 0
+            start = time.perf_counter()
+            asyncio.run(_storage_workload(storage, duration))
+            elapsed = time.perf_counter() - start
+            per_minute = storage.write_count / elapsed * 60
+            print(f"  {label:<18} {storage.write_count:>6} writes  {per_minute:>8.0f} writes/min")
+
+
+def bench_tokens(iterations: int):
+    """Compare get_active_token() with and without the cipher/token cache"""
+    print(f"Active token lookup ({iterations} calls)")
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, "state.json"))
+        storage.add_github_token("bench", "ghp_" + "x" * 36)
+        encrypted = storage.state["github_tokens"]["bench"]
+        
+        # Previous behaviour: derive the key, build a Fernet and decrypt per call
+        start = time.perf_counter()
+        for _ in range(iterations):
+            Fernet(storage._get_encryption_key()).decrypt(encrypted.encode()).decode()
+        uncached = (time.perf_counter() - start) / iterations
+        
+        start = time.perf_counter()
+        for _ in range(iterations):
+            storage.get_active_token()
+        cached = (time.perf_counter() - start) / iterations
+    
+    print(f"  uncached {uncached * 1e6:>10.2f} us/call")
+    print(f"  cached   {cached * 1e6:>10.2f} us/call  ({uncached / cached:.0f}x faster)")
+
+
+FAKE_REPO = "fake-user/vm"
+
+
+@contextlib.asynccontextmanager
+async def _fake_monitor(fake: FakeGitHub, account: str):
+    """A Monitor on a throwaway state file, talking to `fake`"""
+    await close_http_client()
+    open_http_client(transport=fake.transport)
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = Storage(os.path.join(tmp, "state.json"))
+        # A distinct account per scenario gets a fresh GitHubAPI (rate-limit state)
+        storage.add_github_token(account, "ghp_fake")
+        storage.set_active_repo(FAKE_REPO)
+        try:
+            yield Monitor(storage)
+        finally:
+            await close_http_client()
+
+
+async def _quiet_tick(monitor: Monitor, force: bool = True):
+    """Run a tick without its log lines (checking every target unless `force` is off)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        await monitor.tick(force=force)
+
+
+def bench_monitor_tick(ticks: int, latency: float):
+    """Cost of a steady-state tick with one in-progress run that printed its URL"""
+    print(f"Monitor tick ({ticks} ticks, {latency * 1000:.0f} ms API latency)")
+    
+    async def run():
+        fake = FakeGitHub(latency=latency, repos=[FAKE_REPO])
+        fake.add_run(FAKE_REPO, started_ago=60)
+        async with _fake_monitor(fake, "bench-tick") as monitor:
+            await _quiet_tick(monitor)  # first tick reads the log from the start
+            durations = []
+            requests = fake.request_count
+            for _ in range(ticks):
+                start = time.perf_counter()
+                await _quiet_tick(monitor)
+                durations.append(time.perf_counter() - start)
+            requests = (fake.request_count - requests) / ticks
+        return durations, requests
+    
+    durations, requests = asyncio.run(run())
+    print(f"  mean {statistics.mean(durations) * 1000:>8.1f} ms")
+    print(f"  p50  {statistics.median(durations) * 1000:>8.1f} ms")
+    print(f"  max  {max(durations) * 1000:>8.1f} ms")
+    print(f"  {requests:.1f} requests/tick")
+
+
+def bench_outage(outage: float, interval: float, reset_timeout: float):
+    """Time for the monitor to poll successfully again after GitHub comes back"""
+    print(f"Outage recovery ({outage:.0f}s outage, tick every {interval:.1f}s, "
+          f"circuit reset after {reset_timeout:.0f}s)")
+    
+    async def run():
+        fake = FakeGitHub(repos=[FAKE_REPO])
+        fake.add_run(FAKE_REPO, started_ago=60)
+        saved_timeout = circuit_breaker.reset_timeout
+        circuit_breaker.reset_timeout = reset_timeout
+        try:
+            async with _fake_monitor(fake, "bench-outage") as monitor:
+                await _quiet_tick(monitor)
+                fake.outage(outage)
+                outage_end = time.monotonic() + outage
+                recovered = None
+                while recovered is None:
+                    await asyncio.sleep(interval)
+                    served = sum(fake.requests.values())
+                    await _quiet_tick(monitor)
+                    if time.monotonic() >= outage_end and sum(fake.requests.values()) > served:
+                        recovered = time.monotonic() - outage_end
+                return recovered, fake.failure_count
+        finally:
+            circuit_breaker.reset_timeout = saved_timeout
+            circuit_breaker.record_success()
+    
+    recovered, failed = asyncio.run(run())
+    print(f"  {failed} requests sent during the outage")
+    print(f"  recovered {recovered:.1f}s after GitHub came back")
+
+
+def bench_time_to_sshx(fast_interval: float, latency: float, queue_time: float, sshx_delay: float):
+    """Time from an empty repository to the monitor reporting the run's SSHX URL"""
+    print(f"Time to SSHX (fast polling from {fast_interval:.1f}s, {latency * 1000:.0f} ms API latency, "
+          f"run queued {queue_time:.0f}s, URL after {sshx_delay:.0f}s)")
+    
+    async def run():
+        fake = FakeGitHub(latency=latency, queue_time=queue_time, sshx_delay=sshx_delay, repos=[FAKE_REPO])
+        async with _fake_monitor(fake, "bench-sshx") as monitor:
+            monitor.fast_interval = fast_interval
+            start = time.monotonic()
+            ticks = 0
+            # The monitor's own schedule, as in main.background_monitor
+            while not monitor.storage.get_current_sshx_url():
+                await monitor.wait(monitor.next_interval())
+                await _quiet_tick(monitor, force=False)
+                ticks += 1
+            return time.monotonic() - start, ticks, fake.request_count
+    
+    elapsed, ticks, requests = asyncio.run(run())
+    floor = queue_time + sshx_delay
+    print(f"  {elapsed:.1f}s to SSHX ({elapsed - floor:.1f}s after the URL was printed)")
+    print(f"  {ticks} ticks, {requests} requests")
+
+
+def bench_fleet(target_counts: list, workers: int, latency: float, ticks: int = 5):
+    """Steady-state tick latency as the number of monitored repositories grows"""
+    print(f"Fleet tick latency ({workers} workers, {latency * 1000:.0f} ms API latency)")
+    
+    async def run(count: int):
+        fake = FakeGitHub(latency=latency)
+        repos = [FAKE_REPO] + [f"fake-user/vm{i}" for i in range(1, count)]
+        for repo in repos:
+            fake.repos.add(repo)
+            fake.add_run(repo, started_ago=60)
+        async with _fake_monitor(fake, f"bench-fleet-{count}") as monitor:
+            monitor.max_workers = workers
+            for repo in repos[1:]:
+                monitor.storage.add_monitor_target(f"bench-fleet-{count}", repo)
+            await _quiet_tick(monitor)
+            durations = []
+            for _ in range(ticks):
+                start = time.perf_counter()
+                await _quiet_tick(monitor)
+                durations.append(time.perf_counter() - start)
+        return durations
+    
+    for count in target_counts:
+        durations = asyncio.run(run(count))
+        print(f"  {count:>4} targets  mean {statistics.mean(durations) * 1000:>8.1f} ms  "
+              f"max {max(durations) * 1000:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+    
+    storage_parser = sub.add_parser("storage", help="State persistence writes per minute")
+    storage_parser.add_argument("--duration", type=float, default=10.0)
+    
+    tokens_parser = sub.add_parser("tokens", help="Per-request cost of get_active_token()")
+    tokens_parser.add_argument("--iterations", type=int, default=10000)
+    
+    tick_parser = sub.add_parser("monitor-tick", help="Cost of a monitor tick against the fake GitHub")
+    tick_parser.add_argument("--ticks", type=int, default=50)
+    tick_parser.add_argument("--latency", type=float, default=0.05)
+    
+    outage_parser = sub.add_parser("outage", help="Monitor recovery time after a GitHub outage")
+    outage_parser.add_argument("--outage", type=float, default=10.0)
+    outage_parser.add_argument("--interval", type=float, default=1.0)
+    outage_parser.add_argument("--reset-timeout", type=float, default=5.0)
+    
+    sshx_parser = sub.add_parser("time-to-sshx", help="Time from no runs to a reported SSHX URL")
+    sshx_parser.add_argument("--fast-interval", type=float, default=5.0)
+    sshx_parser.add_argument("--latency", type=float, default=0.05)
+    sshx_parser.add_argument("--queue-time", type=float, default=2.0)
+    sshx_parser.add_argument("--sshx-delay", type=float, default=3.0)
+    
+    fleet_parser = sub.add_parser("fleet", help="Tick latency with many monitored repositories")
+    fleet_parser.add_argument("--targets", type=int, nargs="+", default=[1, 10, 25, 50])
+    fleet_parser.add_argument("--workers", type=int, default=8)
+    fleet_parser.add_argument("--latency", type=float, default=0.05)
+    
+    args = parser.parse_args()
+    if args.benchmark == "storage":
+        bench_storage(args.duration)
+    elif args.benchmark == "tokens":
+        bench_tokens(args.iterations)
+    elif args.benchmark == "monitor-tick":
+        bench_monitor_tick(args.ticks, args.latency)
+    elif args.benchmark == "outage":
+        bench_outage(args.outage, args.interval, args.reset_timeout)
+    elif args.benchmark == "time-to-sshx":
+        bench_time_to_sshx(args.fast_interval, args.latency, args.queue_time, args.sshx_delay)
+    elif args.benchmark == "fleet":
+        bench_fleet(args.targets, args.workers, args.latency)
+
+
+if __name__ == "__main__":
+    main()
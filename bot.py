@@ -11,18 +11,36 @@ from typing import Optional
 import os
 
 from storage import Storage
-from github import GitHubAPI
+from github import GitHubAPI, get_github_api, new_correlation_id
+from monitor import Monitor
 from sshx import extract_sshx_url, format_sshx_info
 
 
 class TelegramBot:
-    def __init__(self, token: str, storage: Storage):
+    def __init__(self, token: str, storage: Storage, monitor: Optional[Monitor] = None):
         self.token = token
         self.storage = storage
+        # Woken after runs are started or stopped so its snapshot catches up
+        self.monitor = monitor
         self.app = Application.builder().token(token).build()
         self.authorized_users = set()  # Can be extended with admin list
         self._setup_handlers()
     
+    def _runs_changed(self, repo: str):
+        """Have the monitor re-check a repository whose runs were just started or stopped"""
+        if self.monitor is not None:
+            self.monitor.wake(repo)
+    
+    def _dispatch_started(self, repo: str, correlation_id: str):
+        """Tell the monitor about a dispatch about to be sent, so it does not start another run"""
+        if self.monitor is not None:
+            self.monitor.note_dispatch(repo, correlation_id)
+    
+    def _dispatch_failed(self, repo: str, correlation_id: str):
+        """Release a dispatch registered with _dispatch_started() that GitHub rejected"""
+        if self.monitor is not None:
+            self.monitor.forget_dispatch(repo, correlation_id)
+    
     def _setup_handlers(self):
         """Setup command and callback handlers"""
         # Commands
@@ -513,14 +531,21 @@ class TelegramBot:
         await query.edit_message_text("🔄 Restarting workflow...")
         
         try:
-            github = GitHubAPI(token)
+            github = get_github_api(token, self.storage.get_active_account())
             # Cancel current run if any
             active_runs = await github.get_active_runs(repo)
-            for run in active_runs:
-                await github.cancel_workflow_run(repo, run['id'])
+            if active_runs is None:
+                await query.message.reply_text("❌ Could not fetch workflow runs from GitHub. Try again later.")
+                return
+            await github.cancel_workflow_runs(repo, [run['id'] for run in active_runs])
             
             # Start new workflow
-            success, run_id = await github.trigger_workflow(repo)
+            correlation_id = new_correlation_id()
+            self._dispatch_started(repo, correlation_id)
+            success, run_id = await github.trigger_workflow(repo, correlation_id=correlation_id)
+            if not success:
+                self._dispatch_failed(repo, correlation_id)
+            self._runs_changed(repo)
             
             if success:
                 self.storage.record_restart("Manual restart via bot")
@@ -561,7 +586,7 @@ class TelegramBot:
         except:
             pass
         
-        # Validate token
+        # Validate token (a throwaway client: the token's account is not known yet)
         try:
             github = GitHubAPI(token)
             valid, username = await github.validate_token()
@@ -600,7 +625,7 @@ class TelegramBot:
             username, password = parts
             self.storage.state["web_username"] = username
             self.storage.state["web_password"] = password
-            self.storage._save()
+            self.storage._save("web_username", "web_password")
             
             await update.message.reply_text(
                 "✅ Web credentials updated!\n\n"
@@ -643,8 +668,9 @@ class TelegramBot:
         await query.edit_message_text("📋 Loading repositories...")
         
         try:
-            github = GitHubAPI(token)
-            repos = await github.list_repositories(account)
+            github = get_github_api(token, self.storage.get_active_account())
+            # Fetch one more than we show, to know whether there are more
+            repos = await github.list_repositories(account, limit=11)
             
             text = f"📋 *Repositories for {account}*\n\n"
             
@@ -654,7 +680,7 @@ class TelegramBot:
                     text += f"• `{repo['name']}`\n"
                 
                 if len(repos) > 10:
-                    text += f"\n... and {len(repos) - 10} more"
+                    text += "\n... and more"
             else:
                 text += "No repositories found."
             
@@ -683,7 +709,7 @@ class TelegramBot:
         await query.edit_message_text("🆕 Creating repository...")
         
         try:
-            github = GitHubAPI(token)
+            github = get_github_api(token, self.storage.get_active_account())
             
             # Generate repo name
             repo_name = f"github-vm-{int(datetime.now().timestamp())}"
@@ -728,10 +754,12 @@ class TelegramBot:
             with open(workflow_path, 'r') as f:
                 workflow_content = f.read()
             
-            github = GitHubAPI(token)
-            success = await github.push_workflow_file(repo, workflow_content)
+            github = get_github_api(token, self.storage.get_active_account())
+            status = await github.push_workflow_file(repo, workflow_content)
             
-            if success:
+            if status == "unchanged":
+                await query.message.reply_text("✅ Workflow file is already up to date.")
+            elif status:
                 await query.message.reply_text("✅ Workflow file pushed successfully!")
             else:
                 await query.message.reply_text("❌ Failed to push workflow file.")
@@ -752,8 +780,13 @@ class TelegramBot:
         await query.edit_message_text("▶️ Starting workflow...")
         
         try:
-            github = GitHubAPI(token)
-            success, run_id = await github.trigger_workflow(repo)
+            github = get_github_api(token, self.storage.get_active_account())
+            correlation_id = new_correlation_id()
+            self._dispatch_started(repo, correlation_id)
+            success, run_id = await github.trigger_workflow(repo, correlation_id=correlation_id)
+            if not success:
+                self._dispatch_failed(repo, correlation_id)
+            self._runs_changed(repo)
             
             if success:
                 if run_id:
@@ -778,13 +811,15 @@ class TelegramBot:
         await query.edit_message_text("⏸️ Stopping workflow...")
         
         try:
-            github = GitHubAPI(token)
+            github = get_github_api(token, self.storage.get_active_account())
             active_runs = await github.get_active_runs(repo)
             
-            if active_runs:
-                for run in active_runs:
-                    await github.cancel_workflow_run(repo, run['id'])
-                await query.message.reply_text(f"✅ Stopped {len(active_runs)} workflow(s).")
+            if active_runs is None:
+                await query.message.reply_text("❌ Could not fetch workflow runs from GitHub. Try again later.")
+            elif active_runs:
+                results = await github.cancel_workflow_runs(repo, [run['id'] for run in active_runs])
+                self._runs_changed(repo)
+                await query.message.reply_text(f"✅ Stopped {sum(results.values())} of {len(results)} workflow(s).")
             else:
                 await query.message.reply_text("ℹ️ No active workflows to stop.")
         except Exception as e:
@@ -804,12 +839,14 @@ class TelegramBot:
         await query.edit_message_text("📊 Loading workflow runs...")
         
         try:
-            github = GitHubAPI(token)
+            github = get_github_api(token, self.storage.get_active_account())
             runs = await github.list_workflow_runs(repo, per_page=10)
             
             text = "📊 *Recent Workflow Runs*\n\n"
             
-            if runs:
+            if runs is None:
+                text += "⚠️ Could not fetch workflow runs from GitHub."
+            elif runs:
                 for run in runs:
                     status_emoji = {
                         "completed": "✅",
@@ -857,7 +894,7 @@ class TelegramBot:
         # Only reset counters, not credentials
         self.storage.state["total_restarts"] = 0
         self.storage.state["uptime_seconds"] = 0
-        self.storage._save()
+        self.storage._save("total_restarts", "uptime_seconds")
         
         await query.message.reply_text("✅ Statistics reset successfully!")
         await self.show_settings(update, context)
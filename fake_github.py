@@ -0,0 +1,491 @@
+"""
+Fake GitHub API for offline benchmarks and experiments.
+FakeGitHub emulates the REST endpoints github.py uses (workflow runs,
+dispatches, cancel, jobs and job logs, run log archives, repositories,
+contents and the Git Data API for the default branch) as an httpx
+transport. Listings are paginated with Link headers. Latency, failures and
+outages can be injected, and dispatched runs progress from queued to
+in_progress (printing an SSHX URL after a delay) to completed on their own.
+
+Usage:
+    fake = FakeGitHub(latency=0.05)
+    await close_http_client()
+    open_http_client(transport=fake.transport)
+"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import time
+import zipfile
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Any
+from urllib.parse import urlencode
+
+import httpx
+
+from github import git_blob_sha
+
+
+class FakeRun:
+    """A workflow run whose state is derived from the time since dispatch"""
+    
+    def __init__(self, run_id: int, run_number: int, repo: str, workflow_id: str,
+                 display_title: str, queue_time: float, sshx_delay: float, duration: float):
+        self.id = run_id
+        self.run_number = run_number
+        self.repo = repo
+        self.workflow_id = workflow_id
+        self.display_title = display_title
+        self.queue_time = queue_time
+        self.sshx_delay = sshx_delay
+        self.duration = duration
+        self.started = time.monotonic()
+        self.created_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.finished: Optional[str] = None  # conclusion once forced to finish
+        self.sshx_url = f"https://sshx.io/s/fake{run_id}"
+    
+    def elapsed(self) -> float:
+        """Seconds the run has been in progress (negative while queued)"""
+        return time.monotonic() - self.started - self.queue_time
+    
+    def state(self) -> tuple[str, Optional[str]]:
+        """(status, conclusion)"""
+        if self.finished:
+            return "completed", self.finished
+        elapsed = self.elapsed()
+        if elapsed < 0:
+            return "queued", None
+        if elapsed < self.duration:
+            return "in_progress", None
+        return "completed", "success"
+    
+    def to_json(self) -> Dict[str, Any]:
+        status, conclusion = self.state()
+        return {
+            "id": self.id,
+            "run_number": self.run_number,
+            "name": "VM Worker",
+            "display_title": self.display_title,
+            "status": status,
+            "conclusion": conclusion,
+            "created_at": self.created_at,
+            "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "html_url": f"https://github.com/{self.repo}/actions/runs/{self.id}",
+        }
+    
+    def log(self, heartbeat: float) -> bytes:
+        """Job log produced so far; output only ever grows"""
+        elapsed = self.elapsed()
+        if elapsed < 0:
+            return b""
+        lines = [
+            "🚀 Starting VM Worker...",
+            "📦 Installing SSHX...",
+            "🔗 Starting SSHX server...",
+            "⏳ Waiting for SSHX URL...",
+        ]
+        if elapsed >= self.sshx_delay:
+            lines += [
+                "",
+                "  sshx v0.2.5",
+                "",
+                f"  ➜  Link:  {self.sshx_url}",
+                "  ➜  Shell: /bin/bash",
+                "",
+                "✅ SSHX is ready!",
+                "🔄 Keeping session alive...",
+            ]
+            beats = int((min(elapsed, self.duration) - self.sshx_delay) / heartbeat)
+            lines += [f"⏰ Session active - Uptime: {int((i + 1) * heartbeat)} seconds" for i in range(beats)]
+        return ("\n".join(lines) + "\n").encode()
+
+
+def _sha(*parts: Any) -> str:
+    """Deterministic object id for fake commits and trees"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+class FakeGitHub:
+    """In-memory GitHub API served through an httpx.MockTransport"""
+    
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 queue_time: float = 2.0, sshx_delay: float = 5.0, run_duration: float = 3600.0,
+                 dispatch_delay: float = 0.5, heartbeat: float = 5.0, rate_limit: int = 5000,
+                 login: str = "fake-user", repos: Optional[List[str]] = None, seed: Optional[int] = None):
+        """
+        Args:
+            latency: Seconds added to every response
+            jitter: Extra random latency, up to this many seconds
+            error_rate: Fraction of requests answered with a random 5xx
+            queue_time: Seconds a dispatched run stays queued
+            sshx_delay: Seconds after starting until a run prints its SSHX URL
+            run_duration: Seconds a run stays in progress before succeeding
+            dispatch_delay: Seconds before a dispatched run shows up in listings
+            heartbeat: Seconds between "Session active" log lines
+            rate_limit: Requests per rate-limit window, per token
+            login: User the token belongs to
+            repos: Repositories that exist up front ("owner/name")
+            seed: Seed for latency jitter and injected errors
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.queue_time = queue_time
+        self.sshx_delay = sshx_delay
+        self.run_duration = run_duration
+        self.dispatch_delay = dispatch_delay
+        self.heartbeat = heartbeat
+        self.rate_limit = rate_limit
+        self.login = login
+        self.random = random.Random(seed)
+        
+        self.runs: Dict[int, FakeRun] = {}
+        self.files: Dict[tuple[str, str], bytes] = {}  # (repo, path) -> content on the default branch
+        # Git Data API: the default branch is the only ref
+        self.default_branch = "main"
+        self.heads: Dict[str, str] = {}  # repo -> commit sha of the default branch
+        self.commits: Dict[str, Dict[str, Any]] = {}  # sha -> {"tree", "parents", "message"}
+        self.trees: Dict[str, Dict[str, bytes]] = {}  # sha -> {path: content}
+        self.repos: set = set(repos or [])
+        self.request_count = 0
+        self.failure_count = 0  # requests answered by an injected failure
+        self.requests: Dict[str, int] = {}  # "METHOD route" -> count
+        self.remaining: Dict[str, int] = {}  # Authorization header -> requests left
+        self.reset_at = int(time.time()) + 3600
+        self._next_run_id = 1000
+        self._outage_until = 0.0
+        self._outage_status: Optional[int] = 503
+        self._fail_next: List[Optional[int]] = []
+        self._routes = [
+            ("GET", r"/user", self._get_user),
+            ("GET", r"/users/([^/]+)/repos", self._list_repos),
+            ("POST", r"/user/repos", self._create_repo),
+            ("GET", r"/repos/([^/]+/[^/]+)", self._get_repo),
+            ("POST", r"/repos/([^/]+/[^/]+)/actions/workflows/([^/]+)/dispatches", self._dispatch),
+            ("GET", r"/repos/([^/]+/[^/]+)/actions/workflows/([^/]+)/runs", self._list_runs),
+            ("GET", r"/repos/([^/]+/[^/]+)/actions/runs/(\d+)", self._get_run),
+            ("POST", r"/repos/([^/]+/[^/]+)/actions/runs/(\d+)/cancel", self._cancel_run),
+            ("GET", r"/repos/([^/]+/[^/]+)/actions/runs/(\d+)/jobs", self._list_jobs),
+            ("GET", r"/repos/([^/]+/[^/]+)/actions/runs/(\d+)/logs", self._run_logs),
+            ("GET", r"/repos/([^/]+/[^/]+)/actions/jobs/(\d+)/logs", self._job_logs),
+            ("GET", r"/repos/([^/]+/[^/]+)/contents/(.+)", self._get_contents),
+            ("PUT", r"/repos/([^/]+/[^/]+)/contents/(.+)", self._put_contents),
+            ("GET", r"/repos/([^/]+/[^/]+)/git/ref/heads/(.+)", self._get_ref),
+            ("PATCH", r"/repos/([^/]+/[^/]+)/git/refs/heads/(.+)", self._update_ref),
+            ("GET", r"/repos/([^/]+/[^/]+)/git/commits/([0-9a-f]+)", self._get_commit),
+            ("POST", r"/repos/([^/]+/[^/]+)/git/commits", self._create_commit),
+            ("GET", r"/repos/([^/]+/[^/]+)/git/trees/([0-9a-f]+)", self._get_tree),
+            ("POST", r"/repos/([^/]+/[^/]+)/git/trees", self._create_tree),
+        ]
+    
+    @property
+    def transport(self) -> httpx.MockTransport:
+        """Transport to pass to github.open_http_client()"""
+        return httpx.MockTransport(self.handle)
+    
+    def outage(self, duration: float, status: Optional[int] = 503):
+        """Fail every request for `duration` seconds (status None: connection errors)"""
+        self._outage_until = time.monotonic() + duration
+        self._outage_status = status
+    
+    def fail_next(self, count: int = 1, status: Optional[int] = 502):
+        """Fail the next `count` requests (status None: connection errors)"""
+        self._fail_next.extend([status] * count)
+    
+    def add_run(self, repo: str, workflow_id: str = "vm-worker.yml", display_title: str = "VM Worker",
+                started_ago: float = 0.0) -> FakeRun:
+        """Create a run directly, optionally backdated by `started_ago` seconds"""
+        self.repos.add(repo)
+        run_id = self._next_run_id
+        self._next_run_id += 1
+        run = FakeRun(run_id, len(self.runs) + 1, repo, workflow_id, display_title,
+                      self.queue_time, self.sshx_delay, self.run_duration)
+        run.started -= started_ago
+        self.runs[run_id] = run
+        return run
+    
+    def complete_run(self, run_id: int, conclusion: str = "success"):
+        """Finish a run now"""
+        self.runs[run_id].finished = conclusion
+    
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        """Route a request, applying latency, injected failures and rate limiting"""
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        self.request_count += 1
+        
+        status = None
+        failing = False
+        if self._fail_next:
+            status, failing = self._fail_next.pop(0), True
+        elif time.monotonic() < self._outage_until:
+            status, failing = self._outage_status, True
+        elif self.error_rate and self.random.random() < self.error_rate:
+            status, failing = self.random.choice([500, 502, 503, 504]), True
+        if failing:
+            self.failure_count += 1
+            if status is None:
+                raise httpx.ConnectError("Injected connection failure", request=request)
+            return httpx.Response(status, json={"message": "Injected failure"})
+        
+        path = request.url.path
+        for method, pattern, handler in self._routes:
+            match = re.fullmatch(pattern, path)
+            if method == request.method and match:
+                key = f"{method} {pattern}"
+                self.requests[key] = self.requests.get(key, 0) + 1
+                response = handler(request, *match.groups())
+                break
+        else:
+            response = httpx.Response(404, json={"message": "Not Found"})
+        return self._finish(request, response)
+    
+    def _finish(self, request: httpx.Request, response: httpx.Response) -> httpx.Response:
+        """Add ETag/304 handling and rate-limit headers"""
+        if request.method == "GET" and response.status_code == 200:
+            etag = '"' + hashlib.sha1(response.content).hexdigest() + '"'
+            if request.headers.get("If-None-Match") == etag:
+                response = httpx.Response(304)
+            response.headers["ETag"] = etag
+        token = request.headers.get("Authorization", "")
+        if time.time() >= self.reset_at:
+            self.remaining.clear()
+            self.reset_at = int(time.time()) + 3600
+        remaining = self.remaining.get(token, self.rate_limit)
+        if response.status_code != 304:
+            remaining = self.remaining[token] = max(remaining - 1, 0)
+        response.headers["X-RateLimit-Limit"] = str(self.rate_limit)
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        response.headers["X-RateLimit-Reset"] = str(self.reset_at)
+        return response
+    
+    def _visible_runs(self, repo: str, workflow_id: str) -> List[FakeRun]:
+        """Runs listed by the API, newest first"""
+        cutoff = time.monotonic() - self.dispatch_delay
+        runs = [
+            run for run in self.runs.values()
+            if run.repo == repo and run.workflow_id == workflow_id and run.started <= cutoff
+        ]
+        return sorted(runs, key=lambda run: run.id, reverse=True)
+    
+    @staticmethod
+    def _paginated(request: httpx.Request, items: list) -> tuple[list, Dict[str, str]]:
+        """One page of `items` (page / per_page parameters) and its Link header"""
+        per_page = int(request.url.params.get("per_page", 30))
+        page = int(request.url.params.get("page", 1))
+        last = max((len(items) + per_page - 1) // per_page, 1)
+        
+        def link(number: int) -> str:
+            query = urlencode({**dict(request.url.params), "page": number})
+            return f'<{request.url.copy_with(query=query.encode())}>'
+        
+        links = []
+        if page < last:
+            links += [f'{link(page + 1)}; rel="next"', f'{link(last)}; rel="last"']
+        if page > 1:
+            links += [f'{link(1)}; rel="first"', f'{link(page - 1)}; rel="prev"']
+        headers = {"Link": ", ".join(links)} if links else {}
+        return items[(page - 1) * per_page:page * per_page], headers
+    
+    def _get_user(self, request):
+        return httpx.Response(200, json={"login": self.login})
+    
+    def _list_repos(self, request, username):
+        repos = [
+            {"name": repo.split("/", 1)[1], "full_name": repo, "private": False}
+            for repo in sorted(self.repos) if repo.startswith(f"{username}/")
+        ]
+        page, headers = self._paginated(request, repos)
+        return httpx.Response(200, json=page, headers=headers)
+    
+    def _create_repo(self, request):
+        name = json.loads(request.content)["name"]
+        repo = f"{self.login}/{name}"
+        if repo in self.repos:
+            return httpx.Response(422, json={"message": "Repository creation failed."})
+        self.repos.add(repo)
+        return httpx.Response(201, json={"name": name, "full_name": repo, "private": False})
+    
+    def _get_repo(self, request, repo):
+        if repo not in self.repos:
+            return httpx.Response(404, json={"message": "Not Found"})
+        return httpx.Response(200, json={"full_name": repo, "default_branch": "main", "private": False})
+    
+    def _dispatch(self, request, repo, workflow_id):
+        inputs = json.loads(request.content).get("inputs") or {}
+        title = f"VM Worker {inputs['correlation_id']}" if inputs.get("correlation_id") else "VM Worker"
+        self.add_run(repo, workflow_id, title)
+        return httpx.Response(204)
+    
+    def _list_runs(self, request, repo, workflow_id):
+        runs = self._visible_runs(repo, workflow_id)
+        page, headers = self._paginated(request, runs)
+        return httpx.Response(200, headers=headers, json={
+            "total_count": len(runs),
+            "workflow_runs": [run.to_json() for run in page]
+        })
+    
+    def _get_run(self, request, repo, run_id):
+        run = self.runs.get(int(run_id))
+        if run is None or run.repo != repo:
+            return httpx.Response(404, json={"message": "Not Found"})
+        return httpx.Response(200, json=run.to_json())
+    
+    def _cancel_run(self, request, repo, run_id):
+        run = self.runs.get(int(run_id))
+        if run is None or run.repo != repo:
+            return httpx.Response(404, json={"message": "Not Found"})
+        if run.state()[0] == "completed":
+            return httpx.Response(409, json={"message": "Cannot cancel a workflow run that is completed."})
+        run.finished = "cancelled"
+        return httpx.Response(202, json={})
+    
+    def _list_jobs(self, request, repo, run_id):
+        run = self.runs.get(int(run_id))
+        if run is None or run.repo != repo:
+            return httpx.Response(404, json={"message": "Not Found"})
+        status, conclusion = run.state()
+        job = {"id": run.id * 10, "run_id": run.id, "name": "vm-worker", "status": status, "conclusion": conclusion}
+        return httpx.Response(200, json={"total_count": 1, "jobs": [job]})
+    
+    def _job_logs(self, request, repo, job_id):
+        run = self.runs.get(int(job_id) // 10)
+        if run is None or run.repo != repo or run.state()[0] == "queued":
+            return httpx.Response(404, json={"message": "Not Found"})
+        log = run.log(self.heartbeat)
+        match = re.fullmatch(r"bytes=(\d+)-", request.headers.get("Range", ""))
+        if match is None:
+            return httpx.Response(200, content=log)
+        offset = int(match.group(1))
+        if offset >= len(log):
+            return httpx.Response(416)
+        return httpx.Response(206, content=log[offset:])
+    
+    def _run_logs(self, request, repo, run_id):
+        run = self.runs.get(int(run_id))
+        if run is None or run.repo != repo or run.state()[0] == "queued":
+            return httpx.Response(404, json={"message": "Not Found"})
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr("vm-worker/1_Setup Environment.txt", "🚀 Starting VM Worker...\n")
+            zip_file.writestr("vm-worker/3_Start SSHX Server.txt", run.log(self.heartbeat))
+        return httpx.Response(200, content=archive.getvalue())
+    
+    def _get_contents(self, request, repo, path):
+        content = self.files.get((repo, path))
+        if content is None:
+            return httpx.Response(404, json={"message": "Not Found"})
+        return httpx.Response(200, json={
+            "path": path,
+            "sha": git_blob_sha(content),
+            "content": base64.b64encode(content).decode()
+        })
+    
+    def _put_contents(self, request, repo, path):
+        body = json.loads(request.content)
+        existing = self.files.get((repo, path))
+        if existing is not None and body.get("sha") != git_blob_sha(existing):
+            return httpx.Response(409, json={"message": "sha does not match"})
+        content = base64.b64decode(body["content"])
+        self._head(repo)
+        self.files[(repo, path)] = content
+        self._commit_files(repo, body.get("message", f"Update {path}"))
+        return httpx.Response(200 if existing is not None else 201, json={
+            "content": {"path": path, "sha": git_blob_sha(content)}
+        })
+    
+    def _commit_files(self, repo: str, message: str) -> str:
+        """Commit the repository's current files on top of its head"""
+        tree = {path: content for (file_repo, path), content in self.files.items() if file_repo == repo}
+        tree_sha = _sha("tree", {path: git_blob_sha(content) for path, content in tree.items()})
+        self.trees[tree_sha] = tree
+        parents = [self.heads[repo]] if repo in self.heads else []
+        commit_sha = _sha("commit", tree_sha, parents, message)
+        self.commits[commit_sha] = {"tree": tree_sha, "parents": parents, "message": message}
+        self.heads[repo] = commit_sha
+        return commit_sha
+    
+    def _head(self, repo: str) -> str:
+        """Default branch tip, creating the initial commit on first use"""
+        if repo not in self.heads:
+            self._commit_files(repo, "Initial commit")
+        return self.heads[repo]
+    
+    def _get_ref(self, request, repo, branch):
+        if repo not in self.repos or branch != self.default_branch:
+            return httpx.Response(404, json={"message": "Not Found"})
+        return httpx.Response(200, json={
+            "ref": f"refs/heads/{branch}",
+            "object": {"type": "commit", "sha": self._head(repo)}
+        })
+    
+    def _update_ref(self, request, repo, branch):
+        body = json.loads(request.content)
+        commit = self.commits.get(body["sha"])
+        if repo not in self.repos or branch != self.default_branch or commit is None:
+            return httpx.Response(422, json={"message": "Reference update failed"})
+        if not body.get("force") and self._head(repo) not in commit["parents"]:
+            return httpx.Response(422, json={"message": "Update is not a fast forward"})
+        self.heads[repo] = body["sha"]
+        for key in [key for key in self.files if key[0] == repo]:
+            del self.files[key]
+        for path, content in self.trees[commit["tree"]].items():
+            self.files[(repo, path)] = content
+        return httpx.Response(200, json={
+            "ref": f"refs/heads/{branch}",
+            "object": {"type": "commit", "sha": body["sha"]}
+        })
+    
+    def _commit_json(self, sha: str) -> Dict[str, Any]:
+        commit = self.commits[sha]
+        return {
+            "sha": sha,
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"]},
+            "parents": [{"sha": parent} for parent in commit["parents"]]
+        }
+    
+    def _get_commit(self, request, repo, sha):
+        if sha not in self.commits:
+            return httpx.Response(404, json={"message": "Not Found"})
+        return httpx.Response(200, json=self._commit_json(sha))
+    
+    def _create_commit(self, request, repo):
+        body = json.loads(request.content)
+        if body["tree"] not in self.trees or any(parent not in self.commits for parent in body["parents"]):
+            return httpx.Response(422, json={"message": "Invalid tree or parent"})
+        sha = _sha("commit", body["tree"], body["parents"], body["message"])
+        self.commits[sha] = {"tree": body["tree"], "parents": body["parents"], "message": body["message"]}
+        return httpx.Response(201, json=self._commit_json(sha))
+    
+    def _tree_json(self, sha: str) -> Dict[str, Any]:
+        return {
+            "sha": sha,
+            "truncated": False,
+            "tree": [
+                {"path": path, "mode": "100644", "type": "blob", "sha": git_blob_sha(content)}
+                for path, content in sorted(self.trees[sha].items())
+            ]
+        }
+    
+    def _get_tree(self, request, repo, sha):
+        if sha not in self.trees:
+            return httpx.Response(404, json={"message": "Not Found"})
+        return httpx.Response(200, json=self._tree_json(sha))
+    
+    def _create_tree(self, request, repo):
+        body = json.loads(request.content)
+        base = body.get("base_tree")
+        if base is not None and base not in self.trees:
+            return httpx.Response(422, json={"message": "Invalid base_tree"})
+        tree = dict(self.trees[base]) if base else {}
+        for entry in body["tree"]:
+            tree[entry["path"]] = entry["content"].encode()
+        sha = _sha("tree", {path: git_blob_sha(content) for path, content in tree.items()})
+        self.trees[sha] = tree
+        return httpx.Response(201, json=self._tree_json(sha))
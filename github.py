@@ -4,127 +4,887 @@ Requires Python 3.10+ for modern type hints (tuple[...] syntax).
 """
 import asyncio
 import httpx
-from typing import Optional, Dict, List, Any
+from collections import OrderedDict
+from contextlib import aclosing
+from contextvars import ContextVar
+from typing import Optional, Dict, List, Any, AsyncIterator, Awaitable, BinaryIO, Callable
 import base64
+import functools
+import hashlib
+import inspect
+import math
+import random
+import re
+import tempfile
 import time
+import uuid
 import zipfile
-import io
+from datetime import datetime, timedelta, timezone
 
+from metrics import Counter, Gauge, Histogram
 
+
+# Request priorities. User-facing calls may wait for rate-limit budget;
+# background polling is paced and shed first when budget runs low.
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+
+# Priority of requests issued from the current task (set by background tasks)
+request_priority: ContextVar[int] = ContextVar("github_request_priority", default=PRIORITY_USER)
+
+
+class RateLimitExceeded(Exception):
+    """A request was shed to preserve the token's rate-limit budget"""
+
+
+class RateLimitBudget:
+    """
+    Tracks one token's rate-limit budget from X-RateLimit-* and Retry-After
+    response headers and decides how long a request has to wait.
+    """
+    
+    def __init__(self, reserve: int = 200, pace_below: float = 0.25, max_user_wait: float = 5.0):
+        """
+        Args:
+            reserve: Requests kept for user-facing calls; background calls are
+                shed once the remaining budget drops to this level
+            pace_below: Fraction of the limit below which background calls are
+                spaced evenly over the rest of the window
+            max_user_wait: Longest delay applied to a user-facing call
+        """
+        self.reserve = reserve
+        self.pace_below = pace_below
+        self.max_user_wait = max_user_wait
+        self.limit: Optional[int] = None
+        self.remaining: Optional[int] = None
+        self.reset_at: Optional[float] = None
+        self.blocked_until = 0.0  # secondary rate limit (Retry-After)
+        self._next_background_at = 0.0
+    
+    def update(self, response: httpx.Response):
+        """Record budget headers from a response"""
+        headers = response.headers
+        if "X-RateLimit-Remaining" in headers:
+            self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 0))
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            self.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+        if response.status_code in (403, 429):
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                self.blocked_until = time.time() + float(retry_after)
+            elif self.remaining == 0 and self.reset_at:
+                self.blocked_until = self.reset_at
+    
+    def delay_for(self, priority: int) -> Optional[float]:
+        """Seconds to wait before sending a request, or None to shed it"""
+        now = time.time()
+        background = priority >= PRIORITY_BACKGROUND
+        
+        if self.blocked_until > now:
+            return None if background else min(self.blocked_until - now, self.max_user_wait)
+        if self.remaining is None or not self.reset_at:
+            return 0.0
+        if self.remaining <= 0 and self.reset_at > now:
+            return None if background else min(self.reset_at - now, self.max_user_wait)
+        if not background:
+            return 0.0
+        if self.remaining <= self.reserve:
+            return None
+        if self.limit and self.remaining < self.limit * self.pace_below:
+            # Spread the remaining background budget over the rest of the window
+            spacing = max(self.reset_at - now, 0) / (self.remaining - self.reserve)
+            start = max(now, self._next_background_at)
+            self._next_background_at = start + spacing
+            return start - now
+        return 0.0
+    
+    def is_throttled(self) -> bool:
+        """Whether background calls are currently being shed"""
+        now = time.time()
+        if self.blocked_until > now:
+            return True
+        return (self.remaining is not None and self.remaining <= self.reserve
+                and (self.reset_at or 0) > now)
+    
+    def headroom(self) -> float:
+        """Requests left above the reserve (unknown budgets count as unlimited)"""
+        now = time.time()
+        if self.blocked_until > now:
+            return -math.inf
+        if self.remaining is None or (self.reset_at or 0) <= now:
+            return math.inf
+        return self.remaining - self.reserve
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Budget summary for status endpoints"""
+        now = time.time()
+        return {
+            "limit": self.limit,
+            "remaining": self.remaining,
+            "reset_in_seconds": max(int(self.reset_at - now), 0) if self.reset_at else None,
+            "blocked_for_seconds": max(int(self.blocked_until - now), 0)
+        }
+
+
+class GitHubUnavailable(Exception):
+    """GitHub could not be reached or kept returning server errors"""
+
+
+class CircuitOpenError(GitHubUnavailable):
+    """GitHub is considered unhealthy and requests are paused"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failed calls and rejects
+    requests for `reset_timeout` seconds, then lets a single trial request
+    through (half-open) while the rest keep failing fast: its success closes
+    the breaker, its failure reopens it. A trial that never reports back
+    (e.g. it was cancelled) is replaced after `probe_timeout` seconds.
+    """
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0, probe_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_started_at: Optional[float] = None  # trial request in flight
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open"
+    
+    def allow_request(self) -> bool:
+        """Whether a request may be sent now; in half-open state this claims the trial"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        if self._probe_started_at is not None and now - self._probe_started_at < self.probe_timeout:
+            return False
+        self._probe_started_at = now
+        return True
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started_at = None
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probe_started_at = None
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker summary for status endpoints"""
+        return {"state": self.state, "consecutive_failures": self.failures}
+
+
+# GitHub health is shared by every token, so there is one breaker per process
+circuit_breaker = CircuitBreaker()
+
+# Responses worth retrying; everything else is returned to the caller as-is
+RETRY_STATUS_CODES = {500, 502, 503, 504}
+
+
+# Log archives larger than this are spooled to a temporary file instead of memory
+LOG_SPOOL_THRESHOLD = 4 * 1024 * 1024
+
+
+# Slow-changing metadata: endpoint -> (fresh seconds, extra stale-while-revalidate seconds)
+METADATA_TTLS = {
+    "validate_token": (600.0, 3600.0),
+    "list_repositories": (120.0, 900.0),
+    "check_repository_exists": (300.0, 3600.0),
+    "get_default_branch": (3600.0, 86400.0),
+    "is_public_repository": (3600.0, 86400.0),
+}
+
+# Definitive negative answers (404 repository, 401 token) are cached this long,
+# without a stale window, so a repository created meanwhile shows up soon
+NEGATIVE_TTL = 60.0
+
+# How a metadata loader's answer may be cached
+CACHE_POSITIVE = "positive"
+CACHE_NEGATIVE = "negative"  # definitive "no" from GitHub
+# None: transient failure, never cached
+
+# (token, endpoint, params) -> (stored at, value, negative); shared so one-off instances benefit
+_metadata_cache: Dict[tuple, tuple[float, Any, bool]] = {}
+_revalidating: Dict[tuple, asyncio.Task] = {}
+
+
+# Instrumentation exported on /metrics
+CALL_DURATION = Histogram(
+    "github_call_duration_seconds",
+    "Duration of GitHubAPI method calls (outcome: ok, empty = None/False, error = raised)",
+    ("call", "outcome")
+)
+REQUEST_DURATION = Histogram(
+    "github_request_duration_seconds",
+    "Duration of individual HTTP requests to the GitHub API (priority: user or background)",
+    ("method", "endpoint", "priority")
+)
+REQUESTS = Counter(
+    "github_requests_total",
+    "HTTP requests to the GitHub API by response status (error = transport failure)",
+    ("method", "endpoint", "status")
+)
+DOWNLOADED_BYTES = Counter(
+    "github_downloaded_bytes_total",
+    "Response body bytes received from the GitHub API",
+    ("endpoint",)
+)
+SHARED_CALLS = Counter(
+    "github_shared_calls_total",
+    "Calls answered by joining an identical call already in flight",
+    ("call",)
+)
+RATE_LIMIT_REMAINING = Gauge(
+    "github_rate_limit_remaining",
+    "Requests left in the current rate-limit window",
+    ("account",)
+)
+RATE_LIMIT_LIMIT = Gauge(
+    "github_rate_limit_limit",
+    "Size of the rate-limit window",
+    ("account",)
+)
+
+_ENDPOINT_PATTERNS = [
+    (re.compile(r"^/repos/[^/]+/[^/]+"), "/repos/{repo}"),
+    (re.compile(r"^/users/[^/]+"), "/users/{user}"),
+    (re.compile(r"/contents/.+$"), "/contents/{path}"),
+    (re.compile(r"/(refs?)/heads/.+$"), r"/\1/heads/{branch}"),
+    (re.compile(r"/workflows/[^/]+"), "/workflows/{workflow}"),
+    (re.compile(r"/[0-9a-f]{40}(?=/|$)"), "/{sha}"),
+    (re.compile(r"/\d+(?=/|$)"), "/{id}"),
+]
+
+
+def endpoint_label(path: str) -> str:
+    """Collapse a request path into its endpoint template for metric labels"""
+    for pattern, replacement in _ENDPOINT_PATTERNS:
+        path = pattern.sub(replacement, path)
+    return path
+
+
+def _priority_label() -> str:
+    return "background" if request_priority.get() >= PRIORITY_BACKGROUND else "user"
+
+
+def _timed(name: str, method: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            result = await method(*args, **kwargs)
+            outcome = "empty" if result is None or result is False else "ok"
+            return result
+        finally:
+            CALL_DURATION.observe(time.perf_counter() - start, call=name, outcome=outcome)
+    return wrapper
+
+
+def instrumented(cls):
+    """Class decorator timing every public coroutine method"""
+    for name, member in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.iscoroutinefunction(member):
+            setattr(cls, name, _timed(name, member))
+    return cls
+
+
+# Shared keep-alive connection pool for all GitHubAPI instances
+_http_client: Optional[httpx.AsyncClient] = None
+
+# Cached GitHubAPI instances, keyed by account (or token when no account is known)
+_instances: Dict[str, "GitHubAPI"] = {}
+
+
+def _http2_available() -> bool:
+    """HTTP/2 needs the optional `h2` package (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def open_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """
+    Get the shared HTTP client, creating it if needed.
+    Passing a transport (e.g. fake_github.FakeGitHub().transport) replaces
+    the client with one that sends every request through it; close the
+    current client first.
+    """
+    global _http_client
+    if transport is not None:
+        _http_client = httpx.AsyncClient(transport=transport)
+    elif _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=_http2_available(),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60.0)
+        )
+    return _http_client
+
+
+async def close_http_client():
+    """Close the shared HTTP client and its pooled connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+def git_blob_sha(content: bytes) -> str:
+    """SHA-1 git assigns to a blob with this content (as in `git hash-object`)"""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+def new_correlation_id() -> str:
+    """Random id a dispatch passes to the workflow to find its run later"""
+    return uuid.uuid4().hex[:12]
+
+
+def get_github_api(token: str, account: Optional[str] = None) -> "GitHubAPI":
+    """Get a cached GitHubAPI instance so callers share per-account state"""
+    key = account or token
+    api = _instances.get(key)
+    if api is None or api.token != token:
+        api = GitHubAPI(token, account)
+        _instances[key] = api
+    return api
+
+
+@instrumented
 class GitHubAPI:
-    def __init__(self, token: str):
+    def __init__(self, token: str, account: Optional[str] = None):
         self.token = token
+        self.account = account
         self.base_url = "https://api.github.com"
         self.headers = {
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json"
         }
+        # URL -> last 200 response carrying an ETag/Last-Modified validator
+        self._conditional_cache: OrderedDict[str, httpx.Response] = OrderedDict()
+        self.conditional_cache_size = 256
+        self.rate_limit = RateLimitBudget()
+        # Other accounts' tokens that may serve reads of `_pooled_repos`
+        self._token_pool: Dict[str, str] = {}
+        self._pooled_repos: set = set()
+        # Calls in flight, shared by concurrent identical callers
+        self._inflight: Dict[tuple, asyncio.Future] = {}
     
-    async def validate_token(self) -> tuple[bool, Optional[str]]:
-        """Validate GitHub token and return username"""
-        async with httpx.AsyncClient() as client:
+    async def enable_token_pool(self, repo: str, tokens: Dict[str, str]) -> bool:
+        """
+        Route background read-only requests for `repo` through whichever of these
+        accounts' tokens ({account: token}) has the most rate-limit budget
+        left, so polling can use the budget of every stored account. Only
+        public repositories qualify, since any token can read them.
+        Returns whether pooling is in effect for `repo`.
+        """
+        self._token_pool = {
+            account: token for account, token in tokens.items() if token and token != self.token
+        }
+        if self._token_pool and await self.is_public_repository(repo):
+            self._pooled_repos.add(repo)
+            return True
+        self._pooled_repos.discard(repo)
+        return False
+    
+    def _pool_for(self, path: str) -> List["GitHubAPI"]:
+        """Instances whose tokens may send a GET for `path`, this one first"""
+        if self._token_pool:
+            parts = path.split("/", 4)
+            if len(parts) > 3 and parts[1] == "repos" and f"{parts[2]}/{parts[3]}" in self._pooled_repos:
+                return [self] + [get_github_api(token, account) for account, token in self._token_pool.items()]
+        return [self]
+    
+    def _route(self, method: str, path: str) -> "GitHubAPI":
+        """Pick the instance (token) to send a request through"""
+        # User requests always go through their own account's token
+        if method != "GET" or request_priority.get() < PRIORITY_BACKGROUND:
+            return self
+        return max(self._pool_for(path), key=lambda api: api.rate_limit.headroom())
+    
+    def is_throttled(self, repo: Optional[str] = None) -> bool:
+        """Whether background reads (of `repo`) are shed on every usable token"""
+        path = f"/repos/{repo}" if repo else ""
+        return all(api.rate_limit.is_throttled() for api in self._pool_for(path))
+    
+    async def _request(self, method: str, path: str, conditional: bool = True,
+                       retries: Optional[int] = None, headers: Optional[Dict[str, str]] = None,
+                       **kwargs) -> httpx.Response:
+        """
+        Send a request to the GitHub API over the shared connection pool.
+        GETs are conditional: a cached validator is sent as If-None-Match /
+        If-Modified-Since and a 304 is answered with the cached response
+        (304s do not count against the rate limit). Pass conditional=False
+        for large bodies that should not be kept in memory.
+        
+        Background GETs for repositories in the token pool are sent through
+        the pooled instance with the most budget left (see enable_token_pool()).
+        Concurrent identical GETs of the same priority share one upstream
+        request; the first caller's options (timeout, retries) apply to all
+        of them.
+        
+        Requests are scheduled against the token's rate-limit budget using the
+        priority in `request_priority`; shed requests raise RateLimitExceeded.
+        
+        Transport errors and 5xx responses are retried `retries` times (default:
+        3 for GETs, 0 otherwise) with exponential backoff and jitter, then
+        raise GitHubUnavailable. Failures feed the circuit breaker, and while it
+        is open requests fail fast with CircuitOpenError.
+        """
+        api = self._route(method, path)
+        if api is not self:
+            return await api._request(method, path, conditional, retries, headers, **kwargs)
+        if method == "GET":
+            key = (
+                endpoint_label(path),
+                str(httpx.URL(path, params=kwargs.get("params"))),
+                tuple(sorted((headers or {}).items())),
+                conditional
+            )
+            return await self._singleflight(
+                key, lambda: self._send(method, path, conditional, retries, headers, **kwargs)
+            )
+        return await self._send(method, path, conditional, retries, headers, **kwargs)
+    
+    async def _send(self, method: str, path: str, conditional: bool = True,
+                    retries: Optional[int] = None, headers: Optional[Dict[str, str]] = None,
+                    **kwargs) -> httpx.Response:
+        """Send one request as described in `_request()`"""
+        await self._schedule(method, path)
+        
+        kwargs.setdefault("timeout", 10.0)
+        url = f"{self.base_url}{path}"
+        headers = {**self.headers, **(headers or {})}
+        cache_key = None
+        cached = None
+        
+        if method == "GET" and conditional:
+            cache_key = str(httpx.URL(url, params=kwargs.get("params")))
+            cached = self._conditional_cache.get(cache_key)
+            if cached is not None:
+                if "ETag" in cached.headers:
+                    headers["If-None-Match"] = cached.headers["ETag"]
+                else:
+                    headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+        
+        endpoint = endpoint_label(path)
+        if retries is None:
+            retries = 3 if method == "GET" else 0
+        for attempt in range(retries + 1):
+            if attempt:
+                await self._backoff(attempt)
+            start = time.perf_counter()
             try:
-                response = await client.get(
-                    f"{self.base_url}/user",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    user_data = response.json()
-                    return True, user_data.get("login")
-                return False, None
-            except Exception as e:
-                print(f"Error validating token: {e}")
-                return False, None
-    
-    async def list_repositories(self, username: str) -> List[Dict[str, Any]]:
-        """List user repositories"""
-        async with httpx.AsyncClient() as client:
+                response = await open_http_client().request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError as e:
+                REQUESTS.inc(method=method, endpoint=endpoint, status="error")
+                error = f"{type(e).__name__}: {e}"
+                continue
+            finally:
+                REQUEST_DURATION.observe(time.perf_counter() - start, method=method, endpoint=endpoint,
+                                         priority=_priority_label())
+            REQUESTS.inc(method=method, endpoint=endpoint, status=str(response.status_code))
+            DOWNLOADED_BYTES.inc(len(response.content), endpoint=endpoint)
+            self._update_rate_limit(response)
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+            error = f"HTTP {response.status_code}"
+        else:
+            circuit_breaker.record_failure()
+            raise GitHubUnavailable(f"{method} {path} failed after {retries + 1} attempt(s): {error}")
+        circuit_breaker.record_success()
+        
+        if cache_key is not None:
+            if response.status_code == 304 and cached is not None:
+                self._conditional_cache.move_to_end(cache_key)
+                return cached
+            if response.status_code == 200 and ("ETag" in response.headers or "Last-Modified" in response.headers):
+                self._conditional_cache[cache_key] = response
+                self._conditional_cache.move_to_end(cache_key)
+                while len(self._conditional_cache) > self.conditional_cache_size:
+                    self._conditional_cache.popitem(last=False)
+        return response
+    
+    def _update_rate_limit(self, response: httpx.Response):
+        """Record rate-limit headers and export the budget per account"""
+        self.rate_limit.update(response)
+        if self.rate_limit.remaining is not None:
+            account = self.account or "default"
+            RATE_LIMIT_REMAINING.set(self.rate_limit.remaining, account=account)
+            RATE_LIMIT_LIMIT.set(self.rate_limit.limit, account=account)
+    
+    async def _singleflight(self, key: tuple, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `call()` once for concurrent callers with the same key: callers
+        arriving while it is in flight wait for the same result (or
+        exception). A waiter being cancelled does not cancel the shared call.
+        Only callers of the same `request_priority` share a call, so a user
+        request never inherits a background request's pacing or shedding.
+        """
+        key = key + (request_priority.get(),)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._inflight[key] = task
+            
+            def forget(done: asyncio.Future):
+                self._inflight.pop(key, None)
+                if not done.cancelled():
+                    done.exception()  # retrieved even if every waiter was cancelled
+            
+            task.add_done_callback(forget)
+        else:
+            SHARED_CALLS.inc(call=key[0])
+        return await asyncio.shield(task)
+    
+    async def _schedule(self, method: str, path: str):
+        """Wait for the rate-limit budget and circuit breaker to allow a request"""
+        if circuit_breaker.is_open:
+            raise CircuitOpenError(f"GitHub circuit open, not sending {method} {path}")
+        
+        delay = self.rate_limit.delay_for(request_priority.get())
+        if delay is None:
+            raise RateLimitExceeded(f"Rate-limit budget reserved, shedding {method} {path}")
+        if delay > 0:
+            await asyncio.sleep(delay)
+        
+        # Checked last: in half-open state this claims the single trial request
+        if not circuit_breaker.allow_request():
+            raise CircuitOpenError(f"GitHub circuit open, not sending {method} {path}")
+    
+    @staticmethod
+    async def _backoff(attempt: int):
+        """Exponential backoff with full jitter before retry number `attempt`"""
+        await asyncio.sleep(random.uniform(0, 0.5 * 2 ** attempt))
+    
+    async def _download(self, path: str, fileobj: BinaryIO, retries: int = 3, **kwargs) -> bool:
+        """
+        Stream a GET response body into `fileobj` without buffering it in memory.
+        Returns False for non-200 responses. Retries and circuit breaking work
+        as in `_request()`; a retry starts the download over.
+        """
+        api = self._route("GET", path)
+        if api is not self:
+            return await api._download(path, fileobj, retries, **kwargs)
+        await self._schedule("GET", path)
+        kwargs.setdefault("timeout", 30.0)
+        endpoint = endpoint_label(path)
+        
+        for attempt in range(retries + 1):
+            if attempt:
+                await self._backoff(attempt)
+            fileobj.seek(0)
+            fileobj.truncate()
+            start = time.perf_counter()
             try:
-                response = await client.get(
-                    f"{self.base_url}/users/{username}/repos",
+                async with open_http_client().stream(
+                    "GET",
+                    f"{self.base_url}{path}",
                     headers=self.headers,
-                    params={"sort": "updated", "per_page": 100},
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return []
-            except Exception as e:
-                print(f"Error listing repositories: {e}")
-                return []
+                    follow_redirects=True,
+                    **kwargs
+                ) as response:
+                    REQUESTS.inc(method="GET", endpoint=endpoint, status=str(response.status_code))
+                    self._update_rate_limit(response)
+                    if response.status_code in RETRY_STATUS_CODES:
+                        error = f"HTTP {response.status_code}"
+                        continue
+                    circuit_breaker.record_success()
+                    if response.status_code != 200:
+                        return False
+                    async for chunk in response.aiter_bytes():
+                        DOWNLOADED_BYTES.inc(len(chunk), endpoint=endpoint)
+                        fileobj.write(chunk)
+                    return True
+            except httpx.TransportError as e:
+                REQUESTS.inc(method="GET", endpoint=endpoint, status="error")
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                REQUEST_DURATION.observe(time.perf_counter() - start, method="GET", endpoint=endpoint,
+                                         priority=_priority_label())
+        
+        circuit_breaker.record_failure()
+        raise GitHubUnavailable(f"GET {path} failed after {retries + 1} attempt(s): {error}")
+    
+    @staticmethod
+    def _json(response: httpx.Response) -> Any:
+        """Parse a response body once; cached responses reuse the parsed value"""
+        if not hasattr(response, "_parsed_json"):
+            response._parsed_json = response.json()
+        return response._parsed_json
+    
+    async def _cached(self, endpoint: str, params: tuple,
+                      loader: Callable[[], Awaitable[tuple[Any, Optional[str]]]]) -> Any:
+        """
+        Serve slow-changing metadata from a TTL cache keyed by
+        (token, endpoint, params). Fresh entries are returned as-is; stale
+        entries within the revalidation window are returned immediately while
+        a background task refreshes them. `loader` returns (value, outcome):
+        CACHE_POSITIVE values get the endpoint's TTLs, CACHE_NEGATIVE ones
+        NEGATIVE_TTL, and transient failures (None) are not cached and evict
+        any previous entry.
+        """
+        key = (self.token, endpoint, params)
+        entry = _metadata_cache.get(key)
+        
+        if entry is not None:
+            stored_at, value, negative = entry
+            ttl, stale_ttl = (NEGATIVE_TTL, 0.0) if negative else METADATA_TTLS[endpoint]
+            age = time.monotonic() - stored_at
+            if age < ttl:
+                return value
+            if age < ttl + stale_ttl:
+                if key not in _revalidating:
+                    _revalidating[key] = asyncio.create_task(self._revalidate(key, loader))
+                return value
+        
+        value, outcome = await loader()
+        self._store_metadata(key, value, outcome)
+        return value
+    
+    @staticmethod
+    def _store_metadata(key: tuple, value: Any, outcome: Optional[str]):
+        """Cache a loader's answer, or drop the entry if it was a transient failure"""
+        if outcome is None:
+            _metadata_cache.pop(key, None)
+        else:
+            _metadata_cache[key] = (time.monotonic(), value, outcome == CACHE_NEGATIVE)
+    
+    @classmethod
+    async def _revalidate(cls, key: tuple, loader: Callable[[], Awaitable[tuple[Any, Optional[str]]]]):
+        """Refresh a stale metadata cache entry in the background"""
+        try:
+            value, outcome = await loader()
+            cls._store_metadata(key, value, outcome)
+        finally:
+            _revalidating.pop(key, None)
+    
+    def invalidate_metadata(self, *endpoints: str):
+        """Drop this token's cached metadata for the given endpoints (or all)"""
+        for key in list(_metadata_cache):
+            if key[0] == self.token and (not endpoints or key[1] in endpoints):
+                del _metadata_cache[key]
+    
+    async def validate_token(self) -> tuple[bool, Optional[str]]:
+        """Validate GitHub token and return username"""
+        return await self._cached("validate_token", (), self._validate_token)
+    
+    async def _validate_token(self) -> tuple[tuple[bool, Optional[str]], Optional[str]]:
+        try:
+            response = await self._request(
+                "GET",
+                "/user"
+            )
+            if response.status_code == 200:
+                user_data = self._json(response)
+                return (True, user_data.get("login")), CACHE_POSITIVE
+            if response.status_code == 401:
+                return (False, None), CACHE_NEGATIVE
+            return (False, None), None
+        except Exception as e:
+            print(f"Error validating token: {e}")
+            return (False, None), None
+    
+    async def _paginate(self, path: str, params: Optional[Dict[str, Any]] = None,
+                        items_key: Optional[str] = None, max_concurrency: int = 4,
+                        limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield items from a paginated listing (at most `limit` of them),
+        fetching pages lazily. When the page count is known (a rel="last"
+        Link or a total_count field), pages are fetched up to
+        `max_concurrency` at a time and yielded in order; otherwise rel="next"
+        links are followed one by one. Pages past `limit` are never fetched,
+        and stopping iteration early cancels pages not yet consumed.
+        """
+        params = {"per_page": 100, **(params or {})}
+        remaining = limit
+        
+        async def fetch(page: int) -> httpx.Response:
+            response = await self._request("GET", path, params={**params, "page": page})
+            response.raise_for_status()
+            return response
+        
+        def items(response: httpx.Response) -> List[Dict[str, Any]]:
+            nonlocal remaining
+            data = self._json(response)
+            page_items = data.get(items_key, []) if items_key else data
+            if remaining is not None:
+                page_items = page_items[:remaining]
+                remaining -= len(page_items)
+            return page_items
+        
+        response = await fetch(1)
+        for item in items(response):
+            yield item
+        
+        last_page = None
+        if "last" in response.links:
+            last_page = int(httpx.URL(response.links["last"]["url"]).params.get("page", 1))
+        elif items_key and "total_count" in self._json(response):
+            last_page = -(-self._json(response)["total_count"] // params["per_page"])
+        if last_page is not None and limit is not None:
+            last_page = min(last_page, -(-limit // params["per_page"]))
+        
+        if last_page is None:
+            page = 1
+            while "next" in response.links and remaining != 0:
+                page += 1
+                response = await fetch(page)
+                for item in items(response):
+                    yield item
+            return
+        
+        for window_start in range(2, last_page + 1, max_concurrency):
+            window = range(window_start, min(window_start + max_concurrency, last_page + 1))
+            tasks = [asyncio.create_task(fetch(page)) for page in window]
+            try:
+                for task in tasks:
+                    for item in items(await task):
+                        yield item
+            finally:
+                for task in tasks:
+                    task.cancel()
+    
+    def iter_repositories(self, username: str, per_page: int = 100,
+                          limit: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate over user repositories (all, or the first `limit`), most recently updated first"""
+        return self._paginate(f"/users/{username}/repos", {"sort": "updated", "per_page": per_page}, limit=limit)
+    
+    def iter_workflow_runs(self, repo: str, workflow_id: str = "vm-worker.yml",
+                           per_page: int = 100) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate over all runs of a workflow, newest first"""
+        return self._paginate(
+            f"/repos/{repo}/actions/workflows/{workflow_id}/runs",
+            {"per_page": per_page},
+            items_key="workflow_runs"
+        )
+    
+    async def list_repositories(self, username: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """List user repositories (all pages, or the first `limit`)"""
+        return await self._cached(
+            "list_repositories",
+            (username, limit),
+            lambda: self._list_repositories(username, limit)
+        )
+    
+    async def _list_repositories(self, username: str, limit: Optional[int]) -> tuple[List[Dict[str, Any]], Optional[str]]:
+        repos = []
+        try:
+            per_page = min(limit, 100) if limit else 100
+            async with aclosing(self.iter_repositories(username, per_page, limit)) as repo_iter:
+                async for repo in repo_iter:
+                    repos.append(repo)
+            return repos, CACHE_POSITIVE
+        except Exception as e:
+            print(f"Error listing repositories: {e}")
+            return [], None
     
     async def create_repository(self, name: str, description: str = "GitHub Actions VM Manager") -> tuple[bool, Optional[str]]:
         """Create a new repository"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/user/repos",
-                    headers=self.headers,
-                    json={
-                        "name": name,
-                        "description": description,
-                        "private": False,
-                        "auto_init": True
-                    },
-                    timeout=10.0
-                )
-                if response.status_code == 201:
-                    repo_data = response.json()
-                    return True, repo_data.get("full_name")
-                return False, None
-            except Exception as e:
-                print(f"Error creating repository: {e}")
-                return False, None
+        try:
+            response = await self._request(
+                "POST",
+                "/user/repos",
+                json={
+                    "name": name,
+                    "description": description,
+                    "private": False,
+                    "auto_init": True
+                }
+            )
+            if response.status_code == 201:
+                self.invalidate_metadata("list_repositories", "check_repository_exists")
+                repo_data = response.json()
+                return True, repo_data.get("full_name")
+            return False, None
+        except Exception as e:
+            print(f"Error creating repository: {e}")
+            return False, None
     
     async def check_repository_exists(self, repo_full_name: str) -> bool:
-        """Check if repository exists"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/repos/{repo_full_name}",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                return response.status_code == 200
-            except Exception:
-                return False
+        """Check if repository exists (a 404 is cached briefly, failures not at all)"""
+        return await self._cached(
+            "check_repository_exists",
+            (repo_full_name,),
+            lambda: self._check_repository_exists(repo_full_name)
+        )
     
-    async def create_or_update_file(self, repo: str, path: str, content: str, message: str) -> bool:
-        """Create or update a file in repository"""
-        async with httpx.AsyncClient() as client:
-            try:
-                # Check if file exists
-                get_response = await client.get(
-                    f"{self.base_url}/repos/{repo}/contents/{path}",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                
-                encoded_content = base64.b64encode(content.encode()).decode()
-                data = {
-                    "message": message,
-                    "content": encoded_content
-                }
-                
-                # If file exists, add sha for update
-                if get_response.status_code == 200:
-                    file_data = get_response.json()
-                    data["sha"] = file_data["sha"]
-                
-                response = await client.put(
-                    f"{self.base_url}/repos/{repo}/contents/{path}",
-                    headers=self.headers,
-                    json=data,
-                    timeout=10.0
-                )
-                return response.status_code in [200, 201]
-            except Exception as e:
-                print(f"Error creating/updating file: {e}")
-                return False
+    async def _check_repository_exists(self, repo_full_name: str) -> tuple[bool, Optional[str]]:
+        try:
+            response = await self._request(
+                "GET",
+                f"/repos/{repo_full_name}"
+            )
+            if response.status_code == 200:
+                return True, CACHE_POSITIVE
+            if response.status_code == 404:
+                return False, CACHE_NEGATIVE
+            return False, None
+        except Exception:
+            return False, None
+    
+    async def create_or_update_file(self, repo: str, path: str, content: str, message: str) -> Optional[str]:
+        """
+        Create or update a file in repository.
+        Returns "created", "updated" or "unchanged" (the remote blob already
+        has this content, so no commit is made), or None on failure.
+        """
+        try:
+            # Check if file exists
+            get_response = await self._request(
+                "GET",
+                f"/repos/{repo}/contents/{path}"
+            )
+            
+            content_bytes = content.encode()
+            encoded_content = base64.b64encode(content_bytes).decode()
+            data = {
+                "message": message,
+                "content": encoded_content
+            }
+            
+            # If file exists, add sha for update
+            if get_response.status_code == 200:
+                file_data = self._json(get_response)
+                if file_data["sha"] == git_blob_sha(content_bytes):
+                    return "unchanged"
+                data["sha"] = file_data["sha"]
+            
+            response = await self._request(
+                "PUT",
+                f"/repos/{repo}/contents/{path}",
+                json=data
+            )
+            if response.status_code == 201:
+                return "created"
+            if response.status_code == 200:
+                return "updated"
+            return None
+        except Exception as e:
+            print(f"Error creating/updating file: {e}")
+            return None
     
-    async def push_workflow_file(self, repo: str, workflow_content: str) -> bool:
-        """Push workflow file to repository"""
+    async def push_workflow_file(self, repo: str, workflow_content: str) -> Optional[str]:
+        """Push workflow file to repository; see create_or_update_file for the result"""
         return await self.create_or_update_file(
             repo,
             ".github/workflows/vm-worker.yml",
@@ -132,108 +892,407 @@ class GitHubAPI:
             "Add/Update VM worker workflow"
         )
     
-    async def trigger_workflow(self, repo: str, workflow_id: str = "vm-worker.yml") -> tuple[bool, Optional[int]]:
-        """Trigger a workflow dispatch"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/repos/{repo}/actions/workflows/{workflow_id}/dispatches",
-                    headers=self.headers,
-                    json={"ref": "main"},
-                    timeout=10.0
-                )
-                if response.status_code == 204:
-                    # Wait a bit for the run to be created
-                    await asyncio.sleep(2)
-                    # Get the latest run
-                    runs = await self.list_workflow_runs(repo, workflow_id)
-                    if runs:
-                        return True, runs[0]["id"]
-                    return True, None
-                return False, None
-            except Exception as e:
-                print(f"Error triggering workflow: {e}")
-                return False, None
-    
-    async def list_workflow_runs(self, repo: str, workflow_id: str = "vm-worker.yml", per_page: int = 10) -> List[Dict[str, Any]]:
-        """List workflow runs"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/repos/{repo}/actions/workflows/{workflow_id}/runs",
-                    headers=self.headers,
-                    params={"per_page": per_page},
-                    timeout=10.0
+    async def is_public_repository(self, repo: str) -> Optional[bool]:
+        """Whether a repository is public (None if unknown)"""
+        return await self._cached(
+            "is_public_repository",
+            (repo,),
+            lambda: self._is_public_repository(repo)
+        )
+    
+    async def _is_public_repository(self, repo: str) -> tuple[Optional[bool], Optional[str]]:
+        try:
+            response = await self._request("GET", f"/repos/{repo}")
+            if response.status_code == 200:
+                return not self._json(response).get("private", True), CACHE_POSITIVE
+            return None, None
+        except Exception as e:
+            print(f"Error checking repository visibility: {e}")
+            return None, None
+    
+    async def get_default_branch(self, repo: str) -> Optional[str]:
+        """Get the repository's default branch"""
+        return await self._cached(
+            "get_default_branch",
+            (repo,),
+            lambda: self._get_default_branch(repo)
+        )
+    
+    async def _get_default_branch(self, repo: str) -> tuple[Optional[str], Optional[str]]:
+        try:
+            response = await self._request("GET", f"/repos/{repo}")
+            if response.status_code == 200:
+                branch = self._json(response).get("default_branch")
+                return branch, CACHE_POSITIVE if branch else None
+            return None, None
+        except Exception as e:
+            print(f"Error getting default branch: {e}")
+            return None, None
+    
+    async def sync_files(self, repo: str, files: Dict[str, str], message: str,
+                         branch: Optional[str] = None) -> Optional[Dict[str, str]]:
+        """
+        Write several files ({path: content}) to a branch in a single commit
+        using the Git Data API: read the branch tip and its tree, create one
+        tree holding the changed files on top of it, commit it and move the
+        ref once. Files whose git blob SHA already matches the tree are
+        left out, and no commit is made if nothing changed.
+        Returns {path: "created" | "updated" | "unchanged"}, or None on
+        failure (including the branch moving while we were committing).
+        """
+        try:
+            branch = branch or await self.get_default_branch(repo)
+            if not branch:
+                return None
+            
+            ref_response = await self._request(
+                "GET",
+                f"/repos/{repo}/git/ref/heads/{branch}"
+            )
+            if ref_response.status_code != 200:
+                print(f"Error syncing files: branch {branch} not found ({ref_response.status_code})")
+                return None
+            head_sha = self._json(ref_response)["object"]["sha"]
+            
+            commit_response = await self._request(
+                "GET",
+                f"/repos/{repo}/git/commits/{head_sha}"
+            )
+            if commit_response.status_code != 200:
+                return None
+            base_tree = self._json(commit_response)["tree"]["sha"]
+            
+            tree_response = await self._request(
+                "GET",
+                f"/repos/{repo}/git/trees/{base_tree}",
+                params={"recursive": "1"}
+            )
+            if tree_response.status_code != 200:
+                return None
+            remote_shas = {
+                entry["path"]: entry["sha"]
+                for entry in self._json(tree_response).get("tree", [])
+                if entry.get("type") == "blob"
+            }
+            
+            results = {}
+            entries = []
+            for path, content in files.items():
+                if path not in remote_shas:
+                    results[path] = "created"
+                elif remote_shas[path] == git_blob_sha(content.encode()):
+                    results[path] = "unchanged"
+                    continue
+                else:
+                    results[path] = "updated"
+                # Inline content: GitHub creates the blob as part of the tree
+                entries.append({"path": path, "mode": "100644", "type": "blob", "content": content})
+            
+            if not entries:
+                return results
+            
+            new_tree_response = await self._request(
+                "POST",
+                f"/repos/{repo}/git/trees",
+                json={"base_tree": base_tree, "tree": entries}
+            )
+            if new_tree_response.status_code != 201:
+                return None
+            
+            new_commit_response = await self._request(
+                "POST",
+                f"/repos/{repo}/git/commits",
+                json={
+                    "message": message,
+                    "tree": self._json(new_tree_response)["sha"],
+                    "parents": [head_sha]
+                }
+            )
+            if new_commit_response.status_code != 201:
+                return None
+            
+            # Not forced: fails with 422 if someone pushed since we read the ref
+            update_response = await self._request(
+                "PATCH",
+                f"/repos/{repo}/git/refs/heads/{branch}",
+                json={"sha": self._json(new_commit_response)["sha"]}
+            )
+            if update_response.status_code != 200:
+                print(f"Error syncing files: ref update failed ({update_response.status_code})")
+                return None
+            return results
+        except Exception as e:
+            print(f"Error syncing files: {e}")
+            return None
+    
+    async def trigger_workflow(self, repo: str, workflow_id: str = "vm-worker.yml",
+                               timeout: float = 30.0, correlation_id: Optional[str] = None) -> tuple[bool, Optional[int]]:
+        """
+        Trigger a workflow dispatch and identify the run it created.
+        The dispatch carries a `correlation_id` input (random unless given)
+        that the workflow echoes into its run name; runs are then polled with
+        short backoff until the matching one appears, for at most `timeout`
+        seconds. Returns (True, None) if the dispatch was accepted but its run
+        did not show up in time.
+        """
+        correlation_id = correlation_id or new_correlation_id()
+        dispatched_at = datetime.now(timezone.utc)
+        try:
+            response = await self._request(
+                "POST",
+                f"/repos/{repo}/actions/workflows/{workflow_id}/dispatches",
+                json={"ref": "main", "inputs": {"correlation_id": correlation_id}}
+            )
+            if response.status_code == 422:
+                # The workflow in the repository predates the correlation_id input
+                correlation_id = None
+                response = await self._request(
+                    "POST",
+                    f"/repos/{repo}/actions/workflows/{workflow_id}/dispatches",
+                    json={"ref": "main"}
                 )
-                if response.status_code == 200:
-                    return response.json().get("workflow_runs", [])
-                return []
-            except Exception as e:
-                print(f"Error listing workflow runs: {e}")
-                return []
+            if response.status_code == 204:
+                run_id = await self._find_dispatched_run(repo, workflow_id, correlation_id, dispatched_at, timeout)
+                return True, run_id
+            return False, None
+        except Exception as e:
+            print(f"Error triggering workflow: {e}")
+            return False, None
+    
+    async def _find_dispatched_run(self, repo: str, workflow_id: str, correlation_id: Optional[str],
+                                   dispatched_at: datetime, timeout: float) -> Optional[int]:
+        """
+        Poll workflow runs until the dispatched run shows up.
+        Matches on the correlation id in the run name; without one, falls back
+        to the newest run created after the dispatch.
+        """
+        # Allow for clock skew between this host and GitHub
+        not_before = dispatched_at - timedelta(seconds=10)
+        deadline = time.monotonic() + timeout
+        delay = 0.5
+        while True:
+            await asyncio.sleep(delay)
+            runs = await self.list_workflow_runs(repo, workflow_id) or []
+            for run in runs:
+                if correlation_id is not None:
+                    if correlation_id in (run.get("display_title") or ""):
+                        return run["id"]
+                elif datetime.fromisoformat(run["created_at"].replace('Z', '+00:00')) >= not_before:
+                    return run["id"]
+            if time.monotonic() + delay > deadline:
+                return None
+            delay = min(delay * 1.5, 3.0)
+    
+    async def list_workflow_runs(self, repo: str, workflow_id: str = "vm-worker.yml", per_page: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """List workflow runs. Returns None when the runs could not be fetched."""
+        try:
+            response = await self._request(
+                "GET",
+                f"/repos/{repo}/actions/workflows/{workflow_id}/runs",
+                params={"per_page": per_page}
+            )
+            if response.status_code == 200:
+                return self._json(response).get("workflow_runs", [])
+            print(f"Error listing workflow runs: HTTP {response.status_code}")
+            return None
+        except Exception as e:
+            print(f"Error listing workflow runs: {e}")
+            return None
     
     async def get_workflow_run(self, repo: str, run_id: int) -> Optional[Dict[str, Any]]:
         """Get workflow run details"""
-        async with httpx.AsyncClient() as client:
+        try:
+            response = await self._request(
+                "GET",
+                f"/repos/{repo}/actions/runs/{run_id}"
+            )
+            if response.status_code == 200:
+                return self._json(response)
+            return None
+        except Exception as e:
+            print(f"Error getting workflow run: {e}")
+            return None
+    
+    async def iter_workflow_run_logs(self, repo: str, run_id: int,
+                                     spool_threshold: int = LOG_SPOOL_THRESHOLD) -> AsyncIterator[tuple[str, str]]:
+        """
+        Yield (file name, text) for each step log in a run's log archive.
+        The archive is streamed into a spooled temporary file (kept in memory
+        up to `spool_threshold` bytes) and members are decompressed one at a
+        time, so peak memory is bounded by the largest step log. Yields
+        nothing if the logs are not available.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=spool_threshold) as spool:
+            if not await self._download(f"/repos/{repo}/actions/runs/{run_id}/logs", spool):
+                return
+            spool.seek(0)
             try:
-                response = await client.get(
-                    f"{self.base_url}/repos/{repo}/actions/runs/{run_id}",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                if response.status_code == 200:
-                    return response.json()
-                return None
-            except Exception as e:
-                print(f"Error getting workflow run: {e}")
-                return None
+                zip_file = zipfile.ZipFile(spool)
+            except zipfile.BadZipFile:
+                # If it's not a ZIP file, return as text (fallback)
+                spool.seek(0)
+                yield "", spool.read().decode('utf-8', errors='replace')
+                return
+            with zip_file:
+                # Sort files to maintain order
+                for file_name in sorted(zip_file.namelist()):
+                    if file_name.endswith('.txt'):
+                        with zip_file.open(file_name) as log_file:
+                            yield file_name, log_file.read().decode('utf-8', errors='replace')
     
     async def get_workflow_run_logs(self, repo: str, run_id: int) -> Optional[str]:
-        """Get workflow run logs"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.get(
-                    f"{self.base_url}/repos/{repo}/actions/runs/{run_id}/logs",
-                    headers=self.headers,
-                    timeout=30.0,
-                    follow_redirects=True
-                )
-                if response.status_code == 200:
-                    # GitHub returns logs as a ZIP file, extract and parse it
-                    try:
-                        zip_content = io.BytesIO(response.content)
-                        with zipfile.ZipFile(zip_content) as zip_file:
-                            log_text = []
-                            # Sort files to maintain order
-                            for file_name in sorted(zip_file.namelist()):
-                                if file_name.endswith('.txt'):
-                                    with zip_file.open(file_name) as log_file:
-                                        content = log_file.read().decode('utf-8', errors='replace')
-                                        log_text.append(f"=== {file_name} ===\n{content}\n")
-                            return "\n".join(log_text) if log_text else "No log files found in archive"
-                    except zipfile.BadZipFile:
-                        # If it's not a ZIP file, return as text (fallback)
-                        return response.text
-                return None
-            except Exception as e:
-                print(f"Error getting workflow logs: {e}")
-                return None
+        """
+        Get workflow run logs as a single string.
+        Concurrent requests for the same run share one download.
+        """
+        return await self._singleflight(
+            ("get_workflow_run_logs", repo, run_id),
+            lambda: self._get_workflow_run_logs(repo, run_id)
+        )
+    
+    async def _get_workflow_run_logs(self, repo: str, run_id: int) -> Optional[str]:
+        try:
+            log_text = []
+            async for file_name, content in self.iter_workflow_run_logs(repo, run_id):
+                if file_name:
+                    log_text.append(f"=== {file_name} ===\n{content}\n")
+                else:
+                    log_text.append(content)
+            return "\n".join(log_text) if log_text else None
+        except Exception as e:
+            print(f"Error getting workflow logs: {e}")
+            return None
+    
+    async def list_run_jobs(self, repo: str, run_id: int) -> Optional[List[Dict[str, Any]]]:
+        """List the jobs of a workflow run. Returns None when they could not be fetched."""
+        try:
+            response = await self._request(
+                "GET",
+                f"/repos/{repo}/actions/runs/{run_id}/jobs"
+            )
+            if response.status_code == 200:
+                return self._json(response).get("jobs", [])
+            return None
+        except Exception as e:
+            print(f"Error listing run jobs: {e}")
+            return None
+    
+    async def get_job_log_delta(self, repo: str, job_id: int, offset: int = 0) -> Optional[tuple[bytes, int]]:
+        """
+        Get the bytes of a job's log after `offset` using a Range request.
+        Servers that ignore Range answer 200 with the full log, which is sliced
+        locally. Returns (new bytes, new offset), or None if the log is not
+        available.
+        """
+        try:
+            response = await self._request(
+                "GET",
+                f"/repos/{repo}/actions/jobs/{job_id}/logs",
+                conditional=False,
+                headers={"Range": f"bytes={offset}-"} if offset else None,
+                timeout=30.0,
+                follow_redirects=True
+            )
+            if response.status_code == 206:
+                return response.content, offset + len(response.content)
+            if response.status_code == 200:
+                return response.content[offset:], len(response.content)
+            if response.status_code == 416:
+                # Nothing past the offset yet
+                return b"", offset
+            return None
+        except Exception as e:
+            print(f"Error getting job logs: {e}")
+            return None
     
     async def cancel_workflow_run(self, repo: str, run_id: int) -> bool:
         """Cancel a workflow run"""
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.base_url}/repos/{repo}/actions/runs/{run_id}/cancel",
-                    headers=self.headers,
-                    timeout=10.0
-                )
-                return response.status_code == 202
-            except Exception as e:
-                print(f"Error canceling workflow run: {e}")
-                return False
+        try:
+            # Cancelling is idempotent, so it is safe to retry
+            response = await self._request(
+                "POST",
+                f"/repos/{repo}/actions/runs/{run_id}/cancel",
+                retries=2
+            )
+            return response.status_code == 202
+        except Exception as e:
+            print(f"Error canceling workflow run: {e}")
+            return False
     
-    async def get_active_runs(self, repo: str) -> List[Dict[str, Any]]:
-        """Get currently active (in_progress or queued) workflow runs"""
+    async def cancel_workflow_runs(self, repo: str, run_ids: List[int],
+                                   max_concurrency: int = 8) -> Dict[int, bool]:
+        """Cancel several workflow runs concurrently. Returns run id -> cancelled."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def cancel(run_id: int) -> bool:
+            async with semaphore:
+                return await self.cancel_workflow_run(repo, run_id)
+        
+        results = await asyncio.gather(*(cancel(run_id) for run_id in run_ids))
+        return dict(zip(run_ids, results))
+    
+    async def get_active_runs(self, repo: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get currently active (in_progress or queued) workflow runs.
+        Returns None when the runs could not be fetched, which callers must
+        not mistake for "no active runs".
+        """
         runs = await self.list_workflow_runs(repo, per_page=20)
+        if runs is None:
+            return None
         return [run for run in runs if run["status"] in ["in_progress", "queued"]]
+
+
+
+class JobLogTailer:
+    """
+    Incrementally tails the logs of a run's jobs through the jobs API.
+    Remembers how many bytes of each job log were consumed, so each poll
+    only downloads and returns new output. An incomplete last line is held
+    back until the rest of it arrives, so a URL is never split across polls.
+    """
+    
+    def __init__(self):
+        self.offsets: Dict[int, int] = {}  # job_id -> bytes consumed
+        self._partial: Dict[int, bytes] = {}  # job_id -> unterminated last line
+        self._run_jobs: Dict[int, set] = {}  # run_id -> job ids seen
+    
+    async def poll(self, github: GitHubAPI, repo: str, run_id: int) -> Optional[str]:
+        """
+        Get log output appended since the last poll, across all started jobs.
+        Returns None if no job log could be read (e.g. the jobs API is
+        unavailable), so callers can fall back to the run log archive.
+        """
+        jobs = await github.list_run_jobs(repo, run_id)
+        if jobs is None:
+            return None
+        
+        readable = False
+        chunks = []
+        for job in jobs:
+            if job.get("status") == "queued":
+                continue
+            job_id = job["id"]
+            delta = await github.get_job_log_delta(repo, job_id, self.offsets.get(job_id, 0))
+            if delta is None:
+                continue
+            readable = True
+            new_bytes, self.offsets[job_id] = delta
+            self._run_jobs.setdefault(run_id, set()).add(job_id)
+            
+            data = self._partial.pop(job_id, b"") + new_bytes
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                self._partial[job_id] = data[end:]
+            if end:
+                chunks.append(data[:end].decode('utf-8', errors='replace'))
+        
+        return "".join(chunks) if readable else None
+    
+    def retain(self, run_ids: set):
+        """Forget offsets of runs that are no longer being tailed"""
+        for run_id in list(self._run_jobs):
+            if run_id not in run_ids:
+                for job_id in self._run_jobs.pop(run_id):
+                    self.offsets.pop(job_id, None)
+                    self._partial.pop(job_id, None)
@@ -5,20 +5,28 @@ Manages GitHub Actions workflows as disposable VMs.
 import asyncio
 import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, Query
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
+from typing import Optional, List
 import uvicorn
 from datetime import datetime, timedelta
 import jwt
 import hashlib
-
-from storage import Storage
-from github import GitHubAPI
+import hmac
+import json
+import time
+
+from storage import create_storage
+from github import (
+    GitHubAPI, get_github_api, open_http_client, close_http_client,
+    request_priority, PRIORITY_BACKGROUND, circuit_breaker, new_correlation_id
+)
+from monitor import Monitor
 from bot_notification import TelegramBot
-from sshx import extract_sshx_url
+import metrics
 
 
 # JWT Configuration
@@ -31,11 +39,28 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440  # 24 hours
 
+# GitHub webhooks: with a secret configured, workflow_run / workflow_job events
+# wake the monitor and steady-state polling drops to a slow reconciliation interval
+WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET")
+RECONCILE_INTERVAL = float(os.getenv("MONITOR_RECONCILE_INTERVAL", "300"))
+# Polling cadence: fast from dispatch until the SSHX URL shows up, slow after
+MONITOR_STEADY_INTERVAL = float(os.getenv("MONITOR_STEADY_INTERVAL", "180"))
+MONITOR_FAST_INTERVAL = float(os.getenv("MONITOR_FAST_INTERVAL", "5"))
+# Targets (account/repo pairs) the monitor checks concurrently
+MONITOR_MAX_WORKERS = int(os.getenv("MONITOR_MAX_WORKERS", "8"))
+
 
 # Global state
-storage = Storage()
+storage = create_storage()
 bot = None
 monitor_task = None
+flusher_task = None
+monitor = Monitor(
+    storage,
+    steady_interval=RECONCILE_INTERVAL if WEBHOOK_SECRET else MONITOR_STEADY_INTERVAL,
+    fast_interval=MONITOR_FAST_INTERVAL,
+    max_workers=MONITOR_MAX_WORKERS
+)
 
 
 class LoginRequest(BaseModel):
@@ -88,99 +113,30 @@ async def get_current_user(request: Request):
 async def background_monitor():
     """
     Background task that monitors workflows and auto-restarts them.
-    Runs every 60 seconds.
+    Runs whenever a target's check is due (every few seconds while a VM is
+    starting, every few minutes once it is steady), or right away when a
+    webhook wakes it.
     """
     print("🔄 Background monitor started")
     
+    # Monitor polling is paced and shed before user-facing GitHub calls
+    request_priority.set(PRIORITY_BACKGROUND)
+    
+    last_tick = time.monotonic()
+    uptime_carry = 0.0
     while True:
         try:
-            await asyncio.sleep(60)  # Run every 60 seconds
-            
-            # Increment uptime
-            storage.increment_uptime(60)
-            
-            # Check if we have necessary configuration
-            token = storage.get_active_token()
-            repo = storage.get_active_repo()
-            
-            if not token or not repo:
-                print("⚠️ Monitor: Waiting for GitHub configuration...")
-                continue
-            
-            print(f"🔍 Monitor: Checking workflow status for {repo}...")
-            
-            github = GitHubAPI(token)
+            await monitor.wait(monitor.next_interval())
             
-            # Get active runs
-            active_runs = await github.get_active_runs(repo)
+            # Increment uptime by the time actually elapsed
+            now = time.monotonic()
+            uptime_carry += now - last_tick
+            last_tick = now
+            if uptime_carry >= 1:
+                storage.increment_uptime(int(uptime_carry))
+                uptime_carry -= int(uptime_carry)
             
-            if not active_runs:
-                print("📭 Monitor: No active workflows, starting one...")
-                success, run_id = await github.trigger_workflow(repo)
-                
-                if success:
-                    storage.record_restart("Auto-start: No active workflow")
-                    if run_id:
-                        storage.set_last_run_id(run_id)
-                    print(f"✅ Monitor: Workflow started (run_id: {run_id})")
-                else:
-                    print("❌ Monitor: Failed to start workflow")
-                
-                continue
-            
-            # Check if workflow is running and has SSHX
-            for run in active_runs:
-                run_id = run['id']
-                status = run['status']
-                
-                print(f"🔄 Monitor: Run {run_id} status: {status}")
-                
-                # If workflow is in progress, check for SSHX URL
-                if status == "in_progress":
-                    # Get logs
-                    logs = await github.get_workflow_run_logs(repo, run_id)
-                    
-                    if logs:
-                        sshx_url = extract_sshx_url(logs)
-                        
-                        if sshx_url:
-                            current_url = storage.get_current_sshx_url()
-                            if sshx_url != current_url:
-                                storage.add_sshx_url(sshx_url)
-                                print(f"🔗 Monitor: New SSHX URL found: {sshx_url}")
-                                
-                                # Notify via bot if available
-                                # Bot notification would be sent here
-                        else:
-                            # Check if workflow has been running for a while without SSHX
-                            # This could indicate a problem
-                            created_at = datetime.fromisoformat(run['created_at'].replace('Z', '+00:00'))
-                            now = datetime.now(created_at.tzinfo)
-                            runtime = (now - created_at).total_seconds()
-                            
-                            if runtime > 300:  # 5 minutes without SSHX
-                                print("⚠️ Monitor: Workflow running but no SSHX detected after 5 minutes")
-            
-            # Check for completed workflows
-            all_runs = await github.list_workflow_runs(repo, per_page=5)
-            
-            if all_runs:
-                latest_run = all_runs[0]
-                
-                if latest_run['status'] == 'completed':
-                    conclusion = latest_run.get('conclusion', 'unknown')
-                    print(f"✅ Monitor: Latest workflow completed with conclusion: {conclusion}")
-                    
-                    # Check if there's an active run
-                    if not active_runs:
-                        print("🔄 Monitor: Restarting workflow after completion...")
-                        success, run_id = await github.trigger_workflow(repo)
-                        
-                        if success:
-                            storage.record_restart(f"Auto-restart: Previous run {conclusion}")
-                            if run_id:
-                                storage.set_last_run_id(run_id)
-                            print(f"✅ Monitor: Workflow restarted (run_id: {run_id})")
+            await monitor.tick()
         
         except Exception as e:
             print(f"❌ Monitor error: {e}")
@@ -204,6 +160,25 @@ async def stop_monitor():
             pass
 
 
+async def start_flusher():
+    """Start the write-behind state flusher"""
+    global flusher_task
+    if storage.flush_interval > 0:
+        flusher_task = asyncio.create_task(storage.run_flusher())
+
+
+async def stop_flusher():
+    """Stop the state flusher and persist any pending changes"""
+    if flusher_task:
+        flusher_task.cancel()
+        try:
+            await flusher_task
+        except asyncio.CancelledError:
+            pass
+    # The cancelled flusher may still have a write running in a worker thread
+    await storage.aclose()
+
+
 async def start_bot():
     """Start the Telegram bot"""
     global bot
@@ -239,7 +214,11 @@ async def lifespan(app: FastAPI):
     print(f"👤 Active account: {storage.get_active_account()}")
     print(f"📦 Active repo: {storage.get_active_repo()}")
     
+    # Open the shared GitHub connection pool
+    open_http_client()
+    
     # Start background tasks
+    await start_flusher()
     await start_monitor()
     await start_bot()
     
@@ -251,6 +230,8 @@ async def lifespan(app: FastAPI):
     print("🛑 Shutting down...")
     await stop_monitor()
     await stop_bot()
+    await close_http_client()
+    await stop_flusher()
     print("✅ Shutdown complete")
 
 
@@ -339,16 +320,108 @@ async def health():
     }
 
 
+def verify_webhook_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Check an X-Hub-Signature-256 header against the webhook secret"""
+    if not WEBHOOK_SECRET or not signature or not signature.startswith("sha256="):
+        return False
+    expected = hmac.new(WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature[len("sha256="):], expected)
+
+
+@app.post("/api/github/webhook")
+async def github_webhook(request: Request):
+    """Receive signed workflow_run / workflow_job events from GitHub"""
+    if not WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks are not configured")
+    
+    body = await request.body()
+    if not verify_webhook_signature(body, request.headers.get("X-Hub-Signature-256")):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    
+    event = request.headers.get("X-GitHub-Event", "")
+    if event == "ping":
+        return {"success": True, "message": "pong"}
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+    
+    try:
+        handled = monitor.handle_webhook(event, payload)
+    except (KeyError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail=f"Malformed {event} payload")
+    return {
+        "success": True,
+        "handled": handled
+    }
+
+
+GITHUB_CIRCUIT_OPEN = metrics.Gauge(
+    "github_circuit_open",
+    "1 while the GitHub circuit breaker rejects requests"
+)
+UPTIME = metrics.Gauge(
+    "vm_manager_uptime_seconds",
+    "Accumulated VM uptime recorded by the monitor"
+)
+MONITOR_POLL_INTERVAL = metrics.Gauge(
+    "monitor_poll_interval_seconds",
+    "Current polling interval of each monitored repository",
+    ("repo", "reason")
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics (public, like /health)"""
+    GITHUB_CIRCUIT_OPEN.set(1 if circuit_breaker.is_open else 0)
+    UPTIME.set(storage.get_uptime())
+    MONITOR_POLL_INTERVAL.clear()
+    for target in monitor.get_targets():
+        if target["poll_interval_seconds"] is not None:
+            MONITOR_POLL_INTERVAL.set(target["poll_interval_seconds"], repo=target["repo"], reason=target["poll_reason"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/status")
 async def api_status(user: dict = Depends(get_current_user)):
     """Get system status (authenticated)"""
+    token = storage.get_active_token()
+    rate_limit = None
+    if token:
+        rate_limit = get_github_api(token, storage.get_active_account()).rate_limit.snapshot()
+    
+    # Runs as of the monitor's last check; GitHub is not called here
+    workflow_runs = None
+    snapshot = monitor.get_runs(storage.get_active_repo())
+    if snapshot is not None:
+        runs = snapshot["runs"]
+        workflow_runs = {
+            "fetched_at": snapshot["fetched_at"],
+            "active_runs": [
+                {"id": run["id"], "status": run["status"]}
+                for run in runs if run["status"] in ["in_progress", "queued"]
+            ],
+            "latest_run": {
+                "id": runs[0]["id"],
+                "status": runs[0]["status"],
+                "conclusion": runs[0].get("conclusion"),
+                "created_at": runs[0].get("created_at")
+            } if runs else None
+        }
+    
     return {
         "account": storage.get_active_account(),
         "repository": storage.get_active_repo(),
         "sshx_url": storage.get_current_sshx_url(),
         "uptime_seconds": storage.get_uptime(),
         "restart_info": storage.get_restart_info(),
-        "last_run_id": storage.get_last_run_id()
+        "last_run_id": storage.get_last_run_id(),
+        "rate_limit": rate_limit,
+        "github_circuit": circuit_breaker.snapshot(),
+        "monitor": monitor.schedule(),
+        "workflow_runs": workflow_runs
     }
 
 
@@ -366,11 +439,17 @@ async def status():
 
 
 @app.get("/api/history")
-async def api_history(user: dict = Depends(get_current_user)):
-    """Get SSHX history (authenticated)"""
-    return {
-        "sshx_urls": storage.get_sshx_history()
-    }
+async def api_history(since: Optional[str] = None, until: Optional[str] = None,
+                      user: dict = Depends(get_current_user)):
+    """Get SSHX, restart and workflow run history (authenticated)"""
+    try:
+        return {
+            "sshx_urls": storage.get_sshx_history(),
+            "restarts": storage.get_restart_history(since, until),
+            "runs": storage.get_run_history(since, until)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid since/until timestamp: {e}")
 
 
 @app.post("/api/workflow/start")
@@ -386,8 +465,13 @@ async def api_workflow_start(user: dict = Depends(get_current_user)):
         }
     
     try:
-        github = GitHubAPI(token)
-        success, run_id = await github.trigger_workflow(repo)
+        github = get_github_api(token, storage.get_active_account())
+        correlation_id = new_correlation_id()
+        monitor.note_dispatch(repo, correlation_id)
+        success, run_id = await github.trigger_workflow(repo, correlation_id=correlation_id)
+        if not success:
+            monitor.forget_dispatch(repo, correlation_id)
+        monitor.wake(repo)
         
         if success:
             if run_id:
@@ -423,16 +507,24 @@ async def api_workflow_stop(user: dict = Depends(get_current_user)):
         }
     
     try:
-        github = GitHubAPI(token)
+        github = get_github_api(token, storage.get_active_account())
         active_runs = await github.get_active_runs(repo)
         
+        if active_runs is None:
+            return {
+                "success": False,
+                "error": "Could not fetch workflow runs from GitHub"
+            }
+        
         if active_runs:
-            for run in active_runs:
-                await github.cancel_workflow_run(repo, run['id'])
+            results = await github.cancel_workflow_runs(repo, [run['id'] for run in active_runs])
+            monitor.wake(repo)
+            stopped = sum(results.values())
             
             return {
-                "success": True,
-                "message": f"Stopped {len(active_runs)} workflow(s)"
+                "success": stopped == len(results),
+                "message": f"Stopped {stopped} of {len(results)} workflow(s)",
+                "results": results
             }
         else:
             return {
@@ -459,15 +551,24 @@ async def restart(request: RestartRequest):
         }
     
     try:
-        github = GitHubAPI(token)
+        github = get_github_api(token, storage.get_active_account())
         
         # Cancel active runs
         active_runs = await github.get_active_runs(repo)
-        for run in active_runs:
-            await github.cancel_workflow_run(repo, run['id'])
+        if active_runs is None:
+            return {
+                "success": False,
+                "error": "Could not fetch workflow runs from GitHub"
+            }
+        await github.cancel_workflow_runs(repo, [run['id'] for run in active_runs])
         
         # Start new workflow
-        success, run_id = await github.trigger_workflow(repo)
+        correlation_id = new_correlation_id()
+        monitor.note_dispatch(repo, correlation_id)
+        success, run_id = await github.trigger_workflow(repo, correlation_id=correlation_id)
+        if not success:
+            monitor.forget_dispatch(repo, correlation_id)
+        monitor.wake(repo)
         
         if success:
             storage.record_restart(request.reason)
@@ -612,8 +713,8 @@ async def api_switch_github_account(request: SwitchAccountRequest, user: dict =
 
 # Repository Management Endpoints
 @app.get("/api/repos")
-async def api_list_repos(user: dict = Depends(get_current_user)):
-    """List repositories for active account"""
+async def api_list_repos(limit: Optional[int] = Query(None, ge=1), user: dict = Depends(get_current_user)):
+    """List repositories for active account (all pages, or the first `limit`)"""
     token = storage.get_active_token()
     username = storage.get_active_account()
     
@@ -624,8 +725,8 @@ async def api_list_repos(user: dict = Depends(get_current_user)):
         }
     
     try:
-        github = GitHubAPI(token)
-        repos = await github.list_repositories(username)
+        github = get_github_api(token, storage.get_active_account())
+        repos = await github.list_repositories(username, limit)
         
         return {
             "success": True,
@@ -656,7 +757,7 @@ async def api_create_repo(request: CreateRepoRequest, user: dict = Depends(get_c
         }
     
     try:
-        github = GitHubAPI(token)
+        github = get_github_api(token, storage.get_active_account())
         success, repo_name = await github.create_repository(request.name, request.description)
         
         if success:
@@ -693,7 +794,7 @@ async def api_select_repo(request: SelectRepoRequest, user: dict = Depends(get_c
         }
     
     try:
-        github = GitHubAPI(token)
+        github = get_github_api(token, storage.get_active_account())
         exists = await github.check_repository_exists(request.repo)
         
         if exists:
@@ -714,6 +815,68 @@ async def api_select_repo(request: SelectRepoRequest, user: dict = Depends(get_c
         }
 
 
+class MonitorTargetRequest(BaseModel):
+    account: str
+    repo: str
+
+
+@app.get("/api/monitor/targets")
+async def api_list_monitor_targets(user: dict = Depends(get_current_user)):
+    """List monitored account/repo targets and their status"""
+    return {
+        "success": True,
+        "targets": monitor.get_targets()
+    }
+
+
+@app.post("/api/monitor/targets")
+async def api_add_monitor_target(request: MonitorTargetRequest, user: dict = Depends(get_current_user)):
+    """Keep a workflow running in another repository"""
+    token = storage.get_github_token(request.account)
+    
+    if not token:
+        return {
+            "success": False,
+            "error": f"No GitHub token stored for {request.account}"
+        }
+    
+    try:
+        github = get_github_api(token, request.account)
+        exists = await github.check_repository_exists(request.repo)
+        
+        if exists:
+            storage.add_monitor_target(request.account, request.repo)
+            monitor.wake()
+            return {
+                "success": True,
+                "message": f"Monitoring {request.repo} as {request.account}"
+            }
+        else:
+            return {
+                "success": False,
+                "error": "Repository not found"
+            }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
+@app.post("/api/monitor/targets/remove")
+async def api_remove_monitor_target(request: MonitorTargetRequest, user: dict = Depends(get_current_user)):
+    """Stop monitoring a repository (its runs are left alone)"""
+    if storage.remove_monitor_target(request.account, request.repo):
+        return {
+            "success": True,
+            "message": f"Stopped monitoring {request.repo}"
+        }
+    return {
+        "success": False,
+        "error": "Target not found"
+    }
+
+
 # Workflow Management Endpoints
 @app.get("/api/workflows/files")
 async def api_list_workflow_files(user: dict = Depends(get_current_user)):
@@ -794,17 +957,24 @@ async def api_sync_workflows(request: SyncWorkflowsRequest, user: dict = Depends
         with open(filepath, 'r') as f:
             content = f.read()
         
-        github = GitHubAPI(token)
-        success = await github.create_or_update_file(
+        github = get_github_api(token, storage.get_active_account())
+        status = await github.create_or_update_file(
             repo,
             f".github/workflows/{request.filename}",
             content,
             f"Update workflow: {request.filename}"
         )
         
-        if success:
+        if status == "unchanged":
+            return {
+                "success": True,
+                "status": status,
+                "message": f"Workflow {request.filename} is already up to date"
+            }
+        elif status:
             return {
                 "success": True,
+                "status": status,
                 "message": f"Workflow {request.filename} synced to GitHub"
             }
         else:
@@ -819,10 +989,84 @@ async def api_sync_workflows(request: SyncWorkflowsRequest, user: dict = Depends
         }
 
 
+class BulkSyncWorkflowsRequest(BaseModel):
+    filenames: Optional[List[str]] = None
+
+
+@app.post("/api/workflows/sync/bulk")
+async def api_sync_workflows_bulk(request: BulkSyncWorkflowsRequest, user: dict = Depends(get_current_user)):
+    """Sync several workflow files (default: all of them) in a single commit"""
+    token = storage.get_active_token()
+    repo = storage.get_active_repo()
+    
+    if not token or not repo:
+        return {
+            "success": False,
+            "error": "GitHub token or repository not configured"
+        }
+    
+    try:
+        import os
+        import glob
+        
+        workflow_dir = "workflows"
+        if request.filenames is None:
+            paths = glob.glob(os.path.join(workflow_dir, "*.yml")) + glob.glob(os.path.join(workflow_dir, "*.yaml"))
+            filenames = sorted(os.path.basename(p) for p in paths)
+        else:
+            filenames = request.filenames
+        
+        if not filenames:
+            return {
+                "success": False,
+                "error": "No workflow files to sync"
+            }
+        
+        files = {}
+        for filename in filenames:
+            filepath = os.path.join(workflow_dir, filename)
+            if os.path.basename(filename) != filename or not os.path.exists(filepath):
+                return {
+                    "success": False,
+                    "error": f"Workflow file not found: {filename}"
+                }
+            with open(filepath, 'r') as f:
+                files[f".github/workflows/{filename}"] = f.read()
+        
+        github = get_github_api(token, storage.get_active_account())
+        results = await github.sync_files(
+            repo,
+            files,
+            f"Update workflows: {', '.join(filenames)}"
+        )
+        
+        if results is None:
+            return {
+                "success": False,
+                "error": "Failed to sync workflows"
+            }
+        
+        statuses = {path.rsplit("/", 1)[-1]: status for path, status in results.items()}
+        changed = [name for name, status in statuses.items() if status != "unchanged"]
+        return {
+            "success": True,
+            "files": statuses,
+            "message": (
+                f"Synced {len(changed)} workflow(s) to GitHub in one commit"
+                if changed else "All workflows are already up to date"
+            )
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "error": str(e)
+        }
+
+
 # Workflow Runs Endpoints
 @app.get("/api/runs")
 async def api_list_workflow_runs(user: dict = Depends(get_current_user)):
-    """List recent workflow runs"""
+    """List recent workflow runs, from the monitor's last check when there is one"""
     token = storage.get_active_token()
     repo = storage.get_active_repo()
     
@@ -832,13 +1076,28 @@ async def api_list_workflow_runs(user: dict = Depends(get_current_user)):
             "error": "GitHub token or repository not configured"
         }
     
+    snapshot = monitor.get_runs(repo)
+    if snapshot is not None:
+        return {
+            "success": True,
+            "runs": snapshot["runs"][:10],
+            "fetched_at": snapshot["fetched_at"]
+        }
+    
     try:
-        github = GitHubAPI(token)
+        github = get_github_api(token, storage.get_active_account())
         runs = await github.list_workflow_runs(repo, per_page=10)
         
+        if runs is None:
+            return {
+                "success": False,
+                "error": "Could not fetch workflow runs from GitHub"
+            }
+        
         return {
             "success": True,
-            "runs": runs
+            "runs": runs,
+            "fetched_at": datetime.now().isoformat()
         }
     except Exception as e:
         return {
@@ -860,7 +1119,7 @@ async def api_get_run_logs(run_id: int, user: dict = Depends(get_current_user)):
         }
     
     try:
-        github = GitHubAPI(token)
+        github = get_github_api(token, storage.get_active_account())
         logs = await github.get_workflow_run_logs(repo, run_id)
         
         return {
@@ -906,7 +1165,7 @@ async def api_update_credentials(request: UpdateCredentialsRequest, user: dict =
     if request.new_password:
         storage.state["web_password"] = request.new_password
     
-    storage._save()
+    storage._save("web_username", "web_password")
     
     return {
         "success": True,
@@ -0,0 +1,482 @@
+"""
+Workflow monitor.
+One monitor tick checks the runs of every target (the active account/repo
+plus the configured fleet), tails their logs for SSHX URLs and keeps a
+workflow running in each. Every target has its own polling schedule: fast
+(with backoff) from dispatch until its SSHX URL shows up, slow once it is
+steady. `main.background_monitor` runs a tick whenever a target is due, or
+right away when a webhook reports a change; benchmarks drive ticks directly
+against a fake GitHub.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from storage import Storage
+from github import GitHubAPI, get_github_api, circuit_breaker, JobLogTailer, new_correlation_id
+from sshx import extract_sshx_url
+
+
+# Workflow the monitor keeps running
+WORKFLOW_FILE = "vm-worker.yml"
+# Recent runs fetched per check: one list answers every question of a tick
+RUNS_PER_CHECK = 20
+
+# Why a target is polled at its current interval
+REASON_AWAITING_SSHX = "awaiting_sshx"  # dispatched or running, URL not seen yet
+REASON_STEADY = "steady"  # every running VM has shown its URL
+REASON_ERROR = "error"  # the last check failed
+REASON_THROTTLED = "throttled"  # rate-limit budget reserved for users
+
+
+async def find_sshx_url_in_archive(github: GitHubAPI, repo: str, run_id: int) -> tuple[bool, Optional[str]]:
+    """
+    Scan a run's full log archive step by step for the most recent SSHX URL.
+    Fallback for when per-job logs are unavailable. Returns (logs read, URL).
+    """
+    logs = False
+    sshx_url = None
+    try:
+        async for _, step_log in github.iter_workflow_run_logs(repo, run_id):
+            logs = True
+            sshx_url = extract_sshx_url(step_log) or sshx_url
+    except Exception as e:
+        print(f"⚠️ Monitor: Could not read logs for run {run_id}: {e}")
+    return logs, sshx_url
+
+
+class TargetState:
+    """Monitoring state of one (account, repo) target"""
+    
+    def __init__(self, account: Optional[str], repo: str):
+        self.account = account
+        self.repo = repo
+        self.active = False  # the dashboard's active account/repo
+        self.log_tailer = JobLogTailer()
+        self.run_sshx_urls: Dict[int, str] = {}  # run_id -> SSHX URL, mirrored from storage
+        self.sshx_url: Optional[str] = None
+        self.active_runs: List[Dict[str, Any]] = []
+        # Recent runs (newest first) from the last successful check, served to the API
+        self.runs: Optional[List[Dict[str, Any]]] = None
+        self.runs_fetched_at: Optional[str] = None
+        # Dispatch whose run has not been seen yet: (correlation id, give up at
+        # time.monotonic()); no new dispatch is made while it is pending
+        self.pending_dispatch: Optional[Tuple[Optional[str], float]] = None
+        self.dispatch_task: Optional[asyncio.Future] = None
+        # Polling schedule: checked once time.monotonic() reaches next_check_at
+        self.next_check_at = 0.0
+        self.interval: Optional[float] = None
+        self.reason: Optional[str] = None
+        self.fast_polls = 0  # fast checks since dispatch, for backoff
+        self.last_checked: Optional[str] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[str] = None
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Target status for the API"""
+        return {
+            "account": self.account,
+            "repo": self.repo,
+            "active": self.active,
+            "sshx_url": self.sshx_url,
+            "active_runs": [
+                {"id": run["id"], "status": run["status"], "sshx_url": self.run_sshx_urls.get(run["id"])}
+                for run in self.active_runs
+            ],
+            "poll_interval_seconds": self.interval,
+            "poll_reason": self.reason,
+            "next_check_in_seconds": max(round(self.next_check_at - time.monotonic(), 1), 0),
+            "last_checked": self.last_checked,
+            "last_duration_ms": round(self.last_duration * 1000) if self.last_duration is not None else None,
+            "last_error": self.last_error
+        }
+
+
+class Monitor:
+    """Monitors the workflow runs of every target and auto-restarts them"""
+    
+    def __init__(self, storage: Storage, poll_interval: float = 60.0, steady_interval: float = 180.0,
+                 fast_interval: float = 5.0, fast_backoff: float = 1.5,
+                 max_workers: int = 8, target_timeout: float = 45.0, dispatch_grace: float = 180.0):
+        """
+        Args:
+            storage: State storage
+            poll_interval: Seconds between checks after errors, and the cap
+                for fast polling
+            steady_interval: Seconds between checks once every running VM has
+                shown its SSHX URL (longer when webhooks report changes)
+            fast_interval: First interval after a dispatch; it grows by
+                `fast_backoff` per check until the SSHX URL shows up
+            fast_backoff: Growth factor of the fast polling interval
+            max_workers: Targets checked concurrently
+            target_timeout: Seconds after which a target's check is abandoned
+                so one slow repository cannot hold up the tick
+            dispatch_grace: Seconds to wait for the run of a dispatch that
+                was accepted but not yet listed before dispatching again
+        """
+        self.storage = storage
+        self.poll_interval = poll_interval
+        self.steady_interval = steady_interval
+        self.fast_interval = fast_interval
+        self.fast_backoff = fast_backoff
+        self.max_workers = max_workers
+        self.target_timeout = target_timeout
+        self.dispatch_grace = dispatch_grace
+        self.targets: Dict[tuple, TargetState] = {}  # (account, repo) -> state
+        # Whole-monitor pause (no configuration, GitHub unhealthy)
+        self._hold_until = 0.0
+        self._hold_reason: Optional[str] = None
+        self._wake = asyncio.Event()
+    
+    def wake(self, repo: Optional[str] = None):
+        """
+        Run the next tick now instead of waiting for the interval. With
+        `repo` (after a user started or stopped its runs), that repository's
+        runs snapshot is dropped and it is checked on that tick.
+        """
+        if repo is not None:
+            for state in self.targets.values():
+                if state.repo == repo:
+                    state.runs = None
+                    state.runs_fetched_at = None
+                    state.next_check_at = 0.0
+        self._wake.set()
+    
+    def note_dispatch(self, repo: str, correlation_id: str):
+        """
+        Register a dispatch made outside the monitor (a user starting or
+        restarting `repo`) before it is sent, so the monitor waits for its
+        run instead of dispatching another one.
+        """
+        give_up_at = time.monotonic() + self.dispatch_grace
+        for state in self._refresh_targets():
+            if state.repo == repo:
+                state.pending_dispatch = (correlation_id, give_up_at)
+    
+    def forget_dispatch(self, repo: str, correlation_id: str):
+        """Drop a dispatch registered with note_dispatch() that GitHub rejected"""
+        for state in self.targets.values():
+            if state.repo == repo and state.pending_dispatch is not None and state.pending_dispatch[0] == correlation_id:
+                state.pending_dispatch = None
+    
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for wake(). Returns whether it was woken."""
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout)
+            woken = True
+        except asyncio.TimeoutError:
+            woken = False
+        self._wake.clear()
+        return woken
+    
+    def _schedule(self, target: TargetState, reason: str, dispatched: bool = False):
+        """Set a target's next check from the state its last check found"""
+        if reason == REASON_AWAITING_SSHX:
+            if dispatched:
+                target.fast_polls = 0
+            interval = min(self.fast_interval * self.fast_backoff ** target.fast_polls, self.poll_interval)
+            target.fast_polls += 1
+        elif reason == REASON_STEADY:
+            target.fast_polls = 0
+            interval = self.steady_interval
+        else:
+            interval = self.poll_interval
+        target.interval = round(interval, 1)
+        target.reason = reason
+        target.next_check_at = time.monotonic() + interval
+    
+    def _hold(self, reason: str):
+        """Pause every target for `poll_interval` seconds"""
+        self._hold_until = time.monotonic() + self.poll_interval
+        self._hold_reason = reason
+    
+    def _next_check(self) -> Tuple[float, Optional[TargetState]]:
+        """Monotonic time of the next check and the target it is for (None while held)"""
+        if self._hold_until > time.monotonic() or not self.targets:
+            return self._hold_until, None
+        target = min(self.targets.values(), key=lambda t: t.next_check_at)
+        return target.next_check_at, target
+    
+    def schedule(self) -> Dict[str, Any]:
+        """When the next check happens and why"""
+        at, target = self._next_check()
+        return {
+            "next_check_in_seconds": max(round(at - time.monotonic(), 1), 0),
+            "interval_seconds": target.interval if target else self.poll_interval,
+            "reason": target.reason if target else self._hold_reason,
+            "repo": target.repo if target else None
+        }
+    
+    def next_interval(self) -> float:
+        """Seconds until the next tick is due unless woken"""
+        return max(self._next_check()[0] - time.monotonic(), 0)
+    
+    def _refresh_targets(self) -> List[TargetState]:
+        """Sync per-target state with the configured targets, active one first"""
+        storage = self.storage
+        active_key = None
+        wanted = []
+        if storage.get_active_token() and storage.get_active_repo():
+            active_key = (storage.get_active_account(), storage.get_active_repo())
+            wanted.append(active_key)
+        for target in storage.get_monitor_targets():
+            # One target per repository, or each would start its own VM
+            if all(target["repo"] != repo for _, repo in wanted):
+                wanted.append((target["account"], target["repo"]))
+        
+        for key in list(self.targets):
+            if key not in wanted:
+                del self.targets[key]
+        states = []
+        for key in wanted:
+            state = self.targets.get(key)
+            if state is None:
+                state = self.targets[key] = TargetState(*key)
+            state.active = key == active_key
+            states.append(state)
+        return states
+    
+    def get_targets(self) -> List[Dict[str, Any]]:
+        """Status of every monitored target"""
+        return [state.snapshot() for state in self._refresh_targets()]
+    
+    def get_runs(self, repo: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The runs snapshot of the last check of `repo`, without calling GitHub.
+        None if the repository is not monitored or has not been checked yet.
+        """
+        for state in self.targets.values():
+            if state.repo == repo and state.runs is not None:
+                return {"runs": state.runs, "fetched_at": state.runs_fetched_at}
+        return None
+    
+    def handle_webhook(self, event: str, payload: Dict[str, Any]) -> bool:
+        """
+        Apply a workflow_run / workflow_job webhook event for a monitored
+        repository and wake the monitor. Returns whether the event was used.
+        """
+        event_repo = (payload.get("repository") or {}).get("full_name") or ""
+        targets = {state.repo.lower(): state for state in self._refresh_targets()}
+        target = targets.get(event_repo.lower())
+        if target is None:
+            return False
+        
+        if event == "workflow_run":
+            run = payload["workflow_run"]
+            if os.path.basename(run.get("path") or WORKFLOW_FILE) != WORKFLOW_FILE:
+                return False
+            self.storage.record_run(target.repo, run)
+            print(f"📨 Webhook: Run {run['id']} {payload.get('action')} ({run.get('status')})")
+        elif event == "workflow_job":
+            job = payload["workflow_job"]
+            print(f"📨 Webhook: Job {job['id']} of run {job['run_id']} {payload.get('action')}")
+        else:
+            return False
+        
+        target.next_check_at = 0.0
+        self.wake()
+        return True
+    
+    async def tick(self, force: bool = False):
+        """
+        Check every target that is due (every target with `force`),
+        `max_workers` at a time.
+        """
+        targets = self._refresh_targets()
+        
+        if not targets:
+            print("⚠️ Monitor: Waiting for GitHub configuration...")
+            self._hold("waiting_for_configuration")
+            return
+        
+        if circuit_breaker.is_open:
+            print("⏸️ Monitor: GitHub is unhealthy, pausing until the circuit closes")
+            self._hold("github_unavailable")
+            return
+        self._hold_until = 0.0
+        
+        now = time.monotonic()
+        due = [target for target in targets if force or target.next_check_at <= now]
+        semaphore = asyncio.Semaphore(self.max_workers)
+        
+        async def check(target: TargetState):
+            async with semaphore:
+                await self._check_target(target)
+        
+        await asyncio.gather(*(check(target) for target in due))
+    
+    async def _check_target(self, target: TargetState):
+        """Check one target, recording how long it took and any error, and schedule its next check"""
+        start = time.monotonic()
+        target.last_error = None
+        dispatched = False
+        try:
+            reason, dispatched = await asyncio.wait_for(self._tick_target(target), self.target_timeout)
+        except asyncio.TimeoutError:
+            reason = REASON_ERROR
+            target.last_error = f"Check timed out after {self.target_timeout:.0f}s"
+            print(f"⚠️ Monitor: Checking {target.repo} timed out")
+        except Exception as e:
+            reason = REASON_ERROR
+            target.last_error = str(e)
+            print(f"❌ Monitor error ({target.repo}): {e}")
+        target.last_duration = time.monotonic() - start
+        target.last_checked = datetime.now().isoformat()
+        self._schedule(target, reason, dispatched)
+    
+    async def _tick_target(self, target: TargetState) -> Tuple[str, bool]:
+        """
+        Check one target's runs, look for its SSHX URL and keep a workflow
+        running. Returns (polling reason, whether a run was dispatched).
+        """
+        storage = self.storage
+        repo = target.repo
+        
+        token = storage.get_github_token(target.account)
+        if not token:
+            target.last_error = f"No token stored for {target.account}"
+            print(f"⚠️ Monitor: No token stored for {target.account}, skipping {repo}")
+            return REASON_ERROR, False
+        
+        print(f"🔍 Monitor: Checking workflow status for {repo}...")
+        
+        github = get_github_api(token, target.account)
+        
+        # Spread read-only polling of public repositories over every stored account
+        await github.enable_token_pool(repo, {
+            account: storage.get_github_token(account) for account in storage.get_all_accounts()
+        })
+        
+        if github.is_throttled(repo):
+            print(f"⏸️ Monitor: GitHub rate-limit budget reserved, skipping {repo} this check")
+            return REASON_THROTTLED, False
+        
+        # One snapshot of recent runs: active runs, the latest run and the
+        # restart decision all come from the same list
+        runs = await github.list_workflow_runs(repo, per_page=RUNS_PER_CHECK)
+        
+        if runs is None:
+            # Unknown is not the same as "no runs": never re-trigger on a failed poll
+            target.last_error = "Could not fetch workflow runs"
+            print(f"⚠️ Monitor: Could not fetch workflow runs for {repo}, skipping this check")
+            return REASON_ERROR, False
+        active_runs = [run for run in runs if run["status"] in ["in_progress", "queued"]]
+        target.runs = runs
+        target.runs_fetched_at = datetime.now().isoformat()
+        target.active_runs = active_runs
+        if runs:
+            storage.record_run(repo, runs[0])
+        active_ids = {run['id'] for run in active_runs}
+        
+        # URLs already found survive restarts, so their logs are never read again
+        storage.retain_run_sshx_urls(repo, active_ids)
+        target.run_sshx_urls = storage.get_run_sshx_urls(repo)
+        target.log_tailer.retain(active_ids - set(target.run_sshx_urls))
+        
+        if target.pending_dispatch is not None:
+            correlation_id, give_up_at = target.pending_dispatch
+            if any(correlation_id and correlation_id in (run.get("display_title") or "") for run in runs):
+                target.pending_dispatch = None
+            elif not active_runs and time.monotonic() < give_up_at:
+                # GitHub accepted the dispatch but has not listed its run yet:
+                # dispatching again now would start a duplicate VM
+                print(f"⏳ Monitor: Waiting for the run dispatched in {repo} to appear...")
+                return REASON_AWAITING_SSHX, False
+            elif not active_runs:
+                print(f"⚠️ Monitor: Dispatched run in {repo} never appeared, dispatching again")
+                target.pending_dispatch = None
+        
+        if not active_runs:
+            latest_run = runs[0] if runs else None
+            if latest_run and latest_run['status'] == 'completed':
+                conclusion = latest_run.get('conclusion', 'unknown')
+                print(f"✅ Monitor: Latest workflow completed with conclusion: {conclusion}")
+                print("🔄 Monitor: Restarting workflow after completion...")
+                reason = f"Auto-restart: Previous run {conclusion}"
+            else:
+                print(f"📭 Monitor: No active workflows in {repo}, starting one...")
+                reason = "Auto-start: No active workflow"
+            correlation_id = new_correlation_id()
+            # Claimed before dispatching, so a check that times out after GitHub
+            # accepted the dispatch leaves the next one waiting for its run
+            target.pending_dispatch = (correlation_id, time.monotonic() + self.dispatch_grace)
+            # Shielded: the dispatch outlives a timed-out check and still records its restart
+            target.dispatch_task = asyncio.ensure_future(self._dispatch(target, github, correlation_id, reason))
+            if await asyncio.shield(target.dispatch_task):
+                return REASON_AWAITING_SSHX, True
+            return REASON_ERROR, False
+        
+        # Check if workflow is running and has SSHX
+        for run in active_runs:
+            run_id = run['id']
+            status = run['status']
+            storage.record_run(repo, run)
+            
+            print(f"🔄 Monitor: Run {run_id} status: {status}")
+            
+            # If workflow is in progress, check for SSHX URL
+            if status == "in_progress":
+                if run_id in target.run_sshx_urls:
+                    logs, sshx_url = True, target.run_sshx_urls[run_id]
+                else:
+                    # Only fetch job log output produced since the last check
+                    new_output = await target.log_tailer.poll(github, repo, run_id)
+                    if new_output is not None:
+                        logs, sshx_url = True, extract_sshx_url(new_output)
+                    else:
+                        logs, sshx_url = await find_sshx_url_in_archive(github, repo, run_id)
+                    if sshx_url:
+                        target.run_sshx_urls[run_id] = sshx_url
+                        storage.set_run_sshx_url(repo, run_id, sshx_url)
+                
+                if sshx_url:
+                    if sshx_url != target.sshx_url:
+                        target.sshx_url = sshx_url
+                        print(f"🔗 Monitor: New SSHX URL found for {repo}: {sshx_url}")
+                    if target.active and sshx_url != storage.get_current_sshx_url():
+                        storage.add_sshx_url(sshx_url)
+                        
+                        # Notify via bot if available
+                        # Bot notification would be sent here
+                elif logs and run_id not in target.run_sshx_urls:
+                    # Check if workflow has been running for a while without SSHX
+                    # This could indicate a problem
+                    created_at = datetime.fromisoformat(run['created_at'].replace('Z', '+00:00'))
+                    now = datetime.now(created_at.tzinfo)
+                    runtime = (now - created_at).total_seconds()
+                    
+                    if runtime > 300:  # 5 minutes without SSHX
+                        print(f"⚠️ Monitor: Workflow in {repo} running but no SSHX detected after 5 minutes")
+        
+        # Poll fast until every queued or running VM has shown its SSHX URL
+        # (log output is not pushed by webhooks)
+        awaiting_sshx = any(run['id'] not in target.run_sshx_urls for run in active_runs)
+        return (REASON_AWAITING_SSHX if awaiting_sshx else REASON_STEADY), False
+    
+    async def _dispatch(self, target: TargetState, github: GitHubAPI, correlation_id: str, reason: str) -> bool:
+        """Dispatch a workflow run for a target and record the restart. Returns whether it was accepted."""
+        success, run_id = await github.trigger_workflow(target.repo, correlation_id=correlation_id)
+        # Only release the claim this dispatch made
+        ours = target.pending_dispatch is not None and target.pending_dispatch[0] == correlation_id
+        if not success:
+            if ours:
+                target.pending_dispatch = None
+            target.last_error = "Failed to start workflow"
+            print(f"❌ Monitor: Failed to start workflow in {target.repo}")
+            return False
+        
+        if run_id is not None and ours:
+            target.pending_dispatch = None
+        self._record_restart(target, reason)
+        if run_id and target.active:
+            self.storage.set_last_run_id(run_id)
+        print(f"✅ Monitor: Workflow started (run_id: {run_id})")
+        return True
+    
+    def _record_restart(self, target: TargetState, reason: str):
+        """Record a restart; fleet targets are named in the reason"""
+        if not target.active:
+            reason = f"{reason} ({target.repo})"
+        self.storage.record_restart(reason)
@@ -2,24 +2,48 @@
 State management module for persistent storage.
 Stores GitHub credentials, workflow state, and SSHX history.
 """
+import asyncio
 import json
 import os
+import tempfile
 from datetime import datetime
-from typing import Optional, Dict, List, Any
+from typing import Optional, Dict, List, Any, Set
 from cryptography.fernet import Fernet
 import base64
 import hashlib
 
 
+# Snapshot field recording the last journal record folded into it
+JOURNAL_SEQ_KEY = "_journal_seq"
+
+
 class Storage:
-    def __init__(self, filepath: str = "state.json"):
+    # Fernet cipher shared by all instances; built once per process
+    _cipher: Optional[Fernet] = None
+    
+    def __init__(self, filepath: str = "state.json", flush_interval: float = 0):
+        """
+        Args:
+            filepath: Path of the JSON state file
+            flush_interval: Seconds between background flushes. 0 writes the
+                state synchronously on every mutation; a positive value enables
+                write-behind mode, where mutations only mark the state dirty and
+                `run_flusher()` persists it at most once per interval.
+        """
         self.filepath = filepath
+        self.flush_interval = flush_interval
+        self.write_count = 0
+        self._dirty = False
+        self._pending_write: Optional[asyncio.Future] = None  # write running in a worker thread
+        self._token_cache: Dict[str, str] = {}  # username -> decrypted token
         self.state: Dict[str, Any] = {
             "github_tokens": {},  # username -> encrypted_token
             "active_account": None,
             "active_repo": None,
+            "monitor_targets": [],  # extra {"account", "repo"} pairs the monitor keeps running
             "workflow_id": None,
             "last_run_id": None,
+            "run_sshx_urls": {},  # repo -> {run_id: SSHX URL} of runs still active
             "sshx_urls": [],
             "current_sshx_url": None,
             "uptime_seconds": 0,
@@ -37,7 +61,7 @@ class Storage:
             self.state["web_username"] = "ash"
         if "web_password" not in self.state:
             self.state["web_password"] = "root"
-            self._save()
+            self._save("web_username", "web_password")
         
     def _get_encryption_key(self) -> bytes:
         """Generate encryption key from environment or fixed salt"""
@@ -46,16 +70,20 @@ class Storage:
         key = hashlib.sha256(salt.encode()).digest()
         return base64.urlsafe_b64encode(key)
     
+    def _get_cipher(self) -> Fernet:
+        """Get the process-wide Fernet cipher"""
+        if Storage._cipher is None:
+            Storage._cipher = Fernet(self._get_encryption_key())
+        return Storage._cipher
+    
     def _encrypt(self, data: str) -> str:
         """Encrypt sensitive data"""
-        fernet = Fernet(self._get_encryption_key())
-        return fernet.encrypt(data.encode()).decode()
+        return self._get_cipher().encrypt(data.encode()).decode()
     
     def _decrypt(self, encrypted_data: str) -> str:
         """Decrypt sensitive data"""
         try:
-            fernet = Fernet(self._get_encryption_key())
-            return fernet.decrypt(encrypted_data.encode()).decode()
+            return self._get_cipher().decrypt(encrypted_data.encode()).decode()
         except Exception:
             return ""
     
@@ -65,25 +93,102 @@ class Storage:
             try:
                 with open(self.filepath, 'r') as f:
                     loaded_state = json.load(f)
+                    loaded_state.pop(JOURNAL_SEQ_KEY, None)
                     self.state.update(loaded_state)
             except Exception as e:
                 print(f"Error loading state: {e}")
     
-    def _save(self):
-        """Save state to file"""
+    def _save(self, *keys: str):
+        """
+        Save state to file, or mark it dirty in write-behind mode.
+        `keys` names the top-level fields that changed; engines that persist
+        incrementally only write those. No keys means "anything may have changed".
+        """
+        if self.flush_interval > 0:
+            self._dirty = True
+            return
+        self._write(json.dumps(self.state, indent=2))
+    
+    def _append(self, key: str, entry: Dict[str, Any], limit: int):
+        """Append an entry to a bounded history list"""
+        history = self.state[key]
+        history.append(entry)
+        del history[:-limit]
+    
+    def _write(self, data: str):
+        """Atomically replace the state file with serialized state"""
+        # A temp file per write, so overlapping writes never share one
+        directory, name = os.path.split(os.path.abspath(self.filepath))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{name}.", suffix=".tmp")
         try:
-            with open(self.filepath, 'w') as f:
-                json.dump(self.state, f, indent=2)
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp_path, self.filepath)
+            self.write_count += 1
         except Exception as e:
             print(f"Error saving state: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
+    async def _write_in_thread(self, data: str):
+        """
+        Run `_write` in a worker thread. Cancelling the caller does not stop
+        a thread that already started, so the write is tracked and
+        `aclose()` waits for it before the final flush.
+        """
+        self._pending_write = asyncio.ensure_future(asyncio.to_thread(self._write, data))
+        try:
+            await asyncio.shield(self._pending_write)
+        finally:
+            if self._pending_write.done():
+                self._pending_write = None
+    
+    def flush(self):
+        """Persist pending changes immediately"""
+        if self._dirty:
+            self._dirty = False
+            self._write(json.dumps(self.state, indent=2))
+    
+    async def _flush_async(self):
+        """Persist pending changes without blocking the event loop"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        data = json.dumps(self.state, indent=2)
+        await self._write_in_thread(data)
+    
+    def close(self):
+        """Flush pending changes and release resources"""
+        self.flush()
+    
+    async def aclose(self):
+        """Wait for a background write still in flight, then close()"""
+        if self._pending_write is not None:
+            await self._pending_write
+            self._pending_write = None
+        self.close()
+    
+    async def run_flusher(self):
+        """
+        Background task for write-behind mode.
+        Persists dirty state at most once per flush interval. The state is
+        serialized on the event loop (so it is consistent) and written from a
+        worker thread. Cancel the task and await `aclose()` on shutdown.
+        """
+        if self.flush_interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_async()
     
     def add_github_token(self, username: str, token: str):
         """Add or update GitHub token"""
         encrypted_token = self._encrypt(token)
         self.state["github_tokens"][username] = encrypted_token
+        self._token_cache.pop(username, None)
         if not self.state["active_account"]:
             self.state["active_account"] = username
-        self._save()
+        self._save("github_tokens", "active_account")
     
     def get_github_token(self, username: Optional[str] = None) -> Optional[str]:
         """Get GitHub token for username or active account"""
@@ -91,8 +196,12 @@ class Storage:
             username = self.state["active_account"]
         if not username or username not in self.state["github_tokens"]:
             return None
-        encrypted_token = self.state["github_tokens"][username]
-        return self._decrypt(encrypted_token)
+        token = self._token_cache.get(username)
+        if token is None:
+            token = self._decrypt(self.state["github_tokens"][username])
+            if token:
+                self._token_cache[username] = token
+        return token
     
     def get_active_token(self) -> Optional[str]:
         """Get active GitHub token"""
@@ -102,7 +211,8 @@ class Storage:
         """Set active GitHub account"""
         if username in self.state["github_tokens"]:
             self.state["active_account"] = username
-            self._save()
+            self._token_cache.clear()
+            self._save("active_account")
     
     def get_active_account(self) -> Optional[str]:
         """Get active GitHub account"""
@@ -115,16 +225,36 @@ class Storage:
     def set_active_repo(self, repo: str):
         """Set active repository"""
         self.state["active_repo"] = repo
-        self._save()
+        self._save("active_repo")
     
     def get_active_repo(self) -> Optional[str]:
         """Get active repository"""
         return self.state["active_repo"]
     
+    def add_monitor_target(self, account: str, repo: str):
+        """Have the monitor keep a workflow running in `repo` using `account`'s token"""
+        target = {"account": account, "repo": repo}
+        if target not in self.state["monitor_targets"]:
+            self.state["monitor_targets"] = self.state["monitor_targets"] + [target]
+            self._save("monitor_targets")
+    
+    def remove_monitor_target(self, account: str, repo: str) -> bool:
+        """Stop monitoring a target. Returns whether it was configured."""
+        target = {"account": account, "repo": repo}
+        if target not in self.state["monitor_targets"]:
+            return False
+        self.state["monitor_targets"] = [t for t in self.state["monitor_targets"] if t != target]
+        self._save("monitor_targets")
+        return True
+    
+    def get_monitor_targets(self) -> List[Dict[str, str]]:
+        """Get the extra monitor targets (the active account/repo is always monitored)"""
+        return list(self.state["monitor_targets"])
+    
     def set_workflow_id(self, workflow_id: str):
         """Set workflow ID"""
         self.state["workflow_id"] = workflow_id
-        self._save()
+        self._save("workflow_id")
     
     def get_workflow_id(self) -> Optional[str]:
         """Get workflow ID"""
@@ -133,40 +263,62 @@ class Storage:
     def set_last_run_id(self, run_id: int):
         """Set last workflow run ID"""
         self.state["last_run_id"] = run_id
-        self._save()
+        self._save("last_run_id")
     
     def get_last_run_id(self) -> Optional[int]:
         """Get last workflow run ID"""
         return self.state["last_run_id"]
     
+    def set_run_sshx_url(self, repo: str, run_id: int, url: str):
+        """Remember the SSHX URL found in a run's logs"""
+        runs = self.state["run_sshx_urls"].get(repo, {})
+        if runs.get(str(run_id)) == url:
+            return
+        self.state["run_sshx_urls"] = {**self.state["run_sshx_urls"], repo: {**runs, str(run_id): url}}
+        self._save("run_sshx_urls")
+    
+    def get_run_sshx_urls(self, repo: str) -> Dict[int, str]:
+        """Get the known SSHX URLs of a repository's runs (run_id -> URL)"""
+        return {int(run_id): url for run_id, url in self.state["run_sshx_urls"].get(repo, {}).items()}
+    
+    def retain_run_sshx_urls(self, repo: str, run_ids: Set[int]):
+        """Forget the SSHX URLs of runs that are no longer active"""
+        runs = self.state["run_sshx_urls"].get(repo, {})
+        kept = {run_id: url for run_id, url in runs.items() if int(run_id) in run_ids}
+        if kept == runs:
+            return
+        run_sshx_urls = {key: value for key, value in self.state["run_sshx_urls"].items() if key != repo}
+        if kept:
+            run_sshx_urls[repo] = kept
+        self.state["run_sshx_urls"] = run_sshx_urls
+        self._save("run_sshx_urls")
+    
     def add_sshx_url(self, url: str):
         """Add SSHX URL to history"""
         # Check if URL already exists in the history
         url_exists = any(entry.get("url") == url for entry in self.state["sshx_urls"])
         
         if not url_exists:
-            self.state["sshx_urls"].append({
+            # Keep only last 20 URLs
+            self._append("sshx_urls", {
                 "url": url,
                 "timestamp": datetime.now().isoformat()
-            })
-            # Keep only last 20 URLs
-            if len(self.state["sshx_urls"]) > 20:
-                self.state["sshx_urls"] = self.state["sshx_urls"][-20:]
+            }, limit=20)
         self.state["current_sshx_url"] = url
-        self._save()
+        self._save("current_sshx_url")
     
     def get_current_sshx_url(self) -> Optional[str]:
         """Get current SSHX URL"""
         return self.state["current_sshx_url"]
     
-    def get_sshx_history(self) -> List[Dict[str, str]]:
+    def get_sshx_history(self, limit: int = 10) -> List[Dict[str, str]]:
         """Get SSHX URL history"""
-        return self.state["sshx_urls"][-10:]  # Return last 10
+        return self.state["sshx_urls"][-limit:]
     
     def increment_uptime(self, seconds: int = 60):
         """Increment uptime counter"""
         self.state["uptime_seconds"] += seconds
-        self._save()
+        self._save("uptime_seconds")
     
     def get_uptime(self) -> int:
         """Get uptime in seconds"""
@@ -177,7 +329,7 @@ class Storage:
         self.state["total_restarts"] += 1
         self.state["last_restart_reason"] = reason
         self.state["last_restart_time"] = datetime.now().isoformat()
-        self._save()
+        self._save("total_restarts", "last_restart_reason", "last_restart_time")
     
     def get_restart_info(self) -> Dict[str, Any]:
         """Get restart information"""
@@ -187,9 +339,185 @@ class Storage:
             "last_time": self.state["last_restart_time"]
         }
     
+    def get_restart_history(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Get restart events in an ISO timestamp range.
+        The JSON engines only keep counters, so this is always empty.
+        """
+        return []
+    
+    def record_run(self, repo: str, run: Dict[str, Any]):
+        """Record an observed workflow run (not kept by the JSON engines)"""
+        pass
+    
+    def get_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Get a recorded workflow run"""
+        return None
+    
+    def get_run_history(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get recorded workflow runs created in an ISO timestamp range"""
+        return []
+    
     def get_full_state(self) -> Dict[str, Any]:
         """Get full state (excluding sensitive data)"""
         state_copy = self.state.copy()
         # Don't expose encrypted tokens
         state_copy["github_tokens"] = list(state_copy["github_tokens"].keys())
         return state_copy
+
+
+class JournalStorage(Storage):
+    """
+    Storage engine that appends one compact record per mutation to
+    `<filepath>.journal` instead of rewriting the whole state file.
+    Startup loads the snapshot in `filepath` and replays the journal tail;
+    every `compact_every` records the journal is folded into a new snapshot
+    (written atomically) and truncated.
+    """
+    
+    def __init__(self, filepath: str = "state.json", flush_interval: float = 0,
+                 compact_every: int = 1000):
+        self.journal_path = f"{filepath}.journal"
+        self.compact_every = compact_every
+        self._seq = 0
+        self._pending_records = 0
+        self._journal = None
+        super().__init__(filepath, flush_interval)
+    
+    def _load(self):
+        """Load the latest snapshot and replay journal records after it"""
+        if os.path.exists(self.filepath):
+            try:
+                with open(self.filepath, 'r') as f:
+                    loaded_state = json.load(f)
+                self._seq = loaded_state.pop(JOURNAL_SEQ_KEY, 0)
+                self.state.update(loaded_state)
+            except Exception as e:
+                print(f"Error loading state: {e}")
+        
+        if not os.path.exists(self.journal_path):
+            return
+        valid_bytes = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the tail of the journal: drop it so new
+                    # records do not get appended to a partial line
+                    os.truncate(self.journal_path, valid_bytes)
+                    break
+                valid_bytes += len(line)
+                if record["seq"] <= self._seq:
+                    continue
+                self._apply(record)
+                self._seq = record["seq"]
+                self._pending_records += 1
+    
+    def _apply(self, record: Dict[str, Any]):
+        """Apply a journal record to the in-memory state"""
+        if "set" in record:
+            self.state.update(record["set"])
+        elif "append" in record:
+            history = self.state.setdefault(record["append"], [])
+            history.append(record["value"])
+            del history[:-record["limit"]]
+    
+    def _log(self, record: Dict[str, Any]):
+        """Append a record to the journal"""
+        self._seq += 1
+        record["seq"] = self._seq
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(json.dumps(record, separators=(",", ":")) + "\n")
+        self._pending_records += 1
+        if self.flush_interval > 0:
+            self._dirty = True
+            return
+        self._journal.flush()
+        if self._pending_records >= self.compact_every:
+            self.compact()
+    
+    def _save(self, *keys: str):
+        """Journal the changed fields, or take a snapshot if unknown"""
+        if not keys:
+            self.compact()
+            return
+        self._log({"set": {key: self.state[key] for key in keys}})
+    
+    def _append(self, key: str, entry: Dict[str, Any], limit: int):
+        """Append an entry to a bounded history list and journal it"""
+        super()._append(key, entry, limit)
+        self._log({"append": key, "value": entry, "limit": limit})
+    
+    def _snapshot(self) -> str:
+        """Serialize state together with the journal position it covers"""
+        return json.dumps({**self.state, JOURNAL_SEQ_KEY: self._seq}, indent=2)
+    
+    def _truncate_journal(self):
+        """Start a new, empty journal after a snapshot"""
+        if self._journal is not None:
+            self._journal.close()
+        self._journal = open(self.journal_path, 'w')
+        self._pending_records = 0
+    
+    def compact(self):
+        """Fold the journal into a new snapshot"""
+        if self._journal is not None:
+            self._journal.flush()
+        self._write(self._snapshot())
+        self._truncate_journal()
+    
+    def flush(self):
+        """Flush buffered journal records to disk"""
+        self._dirty = False
+        if self._journal is not None:
+            self._journal.flush()
+        # Never compact alongside a background compaction: if that older
+        # snapshot were replaced last, the truncated journal could not fill
+        # it in. Keeping the journal is always safe.
+        compacting = self._pending_write is not None and not self._pending_write.done()
+        if self._pending_records >= self.compact_every and not compacting:
+            self.compact()
+    
+    async def _flush_async(self):
+        """Flush the journal and compact from a worker thread when due"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        self._journal.flush()
+        if self._pending_records >= self.compact_every:
+            seq = self._seq
+            data = self._snapshot()
+            await self._write_in_thread(data)
+            # Records logged during the write are not in the snapshot; keep the
+            # journal (replay skips what the snapshot covers) and retry later
+            if self._seq == seq:
+                self._truncate_journal()
+    
+    def close(self):
+        """Flush the journal and close it (await `aclose()` to also finish a background compaction)"""
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+
+def create_storage() -> Storage:
+    """
+    Create the storage engine selected by environment configuration:
+    STORAGE_ENGINE (json, journal, sqlite), STATE_FILE and STATE_FLUSH_INTERVAL.
+    """
+    engine = os.getenv("STORAGE_ENGINE", "json").lower()
+    flush_interval = float(os.getenv("STATE_FLUSH_INTERVAL", "5"))
+    
+    if engine == "sqlite":
+        from storage_sqlite import SQLiteStorage
+        return SQLiteStorage(os.getenv("STATE_FILE", "state.db"), flush_interval)
+    
+    filepath = os.getenv("STATE_FILE", "state.json")
+    if engine == "journal":
+        return JournalStorage(filepath, flush_interval)
+    if engine == "json":
+        return Storage(filepath, flush_interval)
+    raise ValueError(f"Unknown STORAGE_ENGINE: {engine}")
@@ -0,0 +1,245 @@
+"""
+SQLite storage engine.
+Implements the Storage interface on a WAL-mode SQLite database with indexed,
+unbounded history tables for SSHX URLs, restarts and observed workflow runs.
+"""
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Optional, Dict, List, Any
+
+from storage import Storage, JournalStorage, JOURNAL_SEQ_KEY
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sshx_urls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL UNIQUE,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sshx_urls_timestamp ON sshx_urls (timestamp);
+CREATE TABLE IF NOT EXISTS restarts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    reason TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_restarts_timestamp ON restarts (timestamp);
+CREATE TABLE IF NOT EXISTS workflow_runs (
+    run_id INTEGER PRIMARY KEY,
+    repo TEXT NOT NULL,
+    run_number INTEGER,
+    status TEXT,
+    conclusion TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_workflow_runs_created_at ON workflow_runs (created_at);
+CREATE INDEX IF NOT EXISTS idx_workflow_runs_repo ON workflow_runs (repo, created_at);
+"""
+
+# State keys kept in their own tables rather than in `settings`
+HISTORY_KEYS = {"sshx_urls"}
+
+
+def utc_timestamp(timestamp: str) -> str:
+    """
+    Normalize an ISO timestamp to UTC "YYYY-MM-DDTHH:MM:SSZ", the format
+    GitHub uses, so timestamps compare correctly as strings. Naive values
+    are local time. Raises ValueError for malformed input.
+    """
+    moment = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    return moment.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _time_range(column: str, since: Optional[str], until: Optional[str]) -> tuple[str, list]:
+    """Build a WHERE clause for an ISO timestamp range (any offset; compared in UTC)"""
+    conditions, params = [], []
+    if since:
+        conditions.append(f"{column} >= ?")
+        params.append(utc_timestamp(since))
+    if until:
+        conditions.append(f"{column} < ?")
+        params.append(utc_timestamp(until))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, filepath: str = "state.db", flush_interval: float = 0,
+                 import_from: Optional[str] = "state.json"):
+        """
+        Args:
+            filepath: Path of the SQLite database
+            flush_interval: Seconds between commits in write-behind mode
+                (0 commits every mutation)
+            import_from: JSON state file imported when the database is new
+        """
+        self.import_from = import_from
+        self.conn = sqlite3.connect(filepath, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._normalize_timestamps()
+        super().__init__(filepath, flush_interval)
+    
+    def _normalize_timestamps(self):
+        """Convert history timestamps written before they were stored in UTC"""
+        for table, key, column in (("sshx_urls", "id", "timestamp"), ("restarts", "id", "timestamp"),
+                                   ("workflow_runs", "run_id", "created_at")):
+            rows = self.conn.execute(
+                f"SELECT {key}, {column} FROM {table} WHERE {column} IS NOT NULL AND {column} NOT LIKE '%Z'"
+            ).fetchall()
+            self.conn.executemany(
+                f"UPDATE {table} SET {column} = ? WHERE {key} = ?",
+                [(utc_timestamp(row[column]), row[key]) for row in rows]
+            )
+        self.conn.commit()
+    
+    def _load(self):
+        """Load settings from the database, importing legacy JSON state if new"""
+        rows = self.conn.execute("SELECT key, value FROM settings").fetchall()
+        if rows:
+            for row in rows:
+                self.state[row["key"]] = json.loads(row["value"])
+            return
+        
+        if self.import_from and os.path.exists(self.import_from):
+            try:
+                if os.path.exists(f"{self.import_from}.journal"):
+                    # Replay records logged since the last compaction
+                    legacy = JournalStorage(self.import_from)
+                    loaded_state = dict(legacy.state)
+                    legacy.close()
+                else:
+                    with open(self.import_from, 'r') as f:
+                        loaded_state = json.load(f)
+            except Exception as e:
+                print(f"Error importing state: {e}")
+                return
+            loaded_state.pop(JOURNAL_SEQ_KEY, None)
+            for entry in loaded_state.pop("sshx_urls", []):
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO sshx_urls (url, timestamp) VALUES (?, ?)",
+                    (entry["url"], utc_timestamp(entry["timestamp"]))
+                )
+            self.state.update(loaded_state)
+        self._save()
+    
+    def _save(self, *keys: str):
+        """Upsert changed settings; commit now or on the next flush"""
+        if not keys:
+            keys = [key for key in self.state if key not in HISTORY_KEYS]
+        self.conn.executemany(
+            "INSERT INTO settings (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            [(key, json.dumps(self.state[key])) for key in keys]
+        )
+        self._commit()
+    
+    def _commit(self):
+        """Commit the current transaction, or defer it in write-behind mode"""
+        if self.flush_interval > 0:
+            self._dirty = True
+            return
+        self.conn.commit()
+        self.write_count += 1
+    
+    def flush(self):
+        """Commit pending changes"""
+        if self._dirty:
+            self._dirty = False
+            self.conn.commit()
+            self.write_count += 1
+    
+    async def _flush_async(self):
+        """Commit pending changes (a WAL commit is cheap enough for the loop)"""
+        self.flush()
+    
+    def close(self):
+        """Commit pending changes and close the database"""
+        self.flush()
+        self.conn.close()
+    
+    def add_sshx_url(self, url: str):
+        """Add SSHX URL to history"""
+        self.conn.execute(
+            "INSERT OR IGNORE INTO sshx_urls (url, timestamp) VALUES (?, ?)",
+            (url, utc_timestamp(datetime.now().isoformat()))
+        )
+        self.state["current_sshx_url"] = url
+        self._save("current_sshx_url")
+    
+    def get_sshx_history(self, limit: int = 10) -> List[Dict[str, str]]:
+        """Get the most recent SSHX URLs, oldest first"""
+        rows = self.conn.execute(
+            "SELECT url, timestamp FROM sshx_urls ORDER BY id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+    
+    def get_sshx_history_range(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, str]]:
+        """Get SSHX URLs first seen in an ISO timestamp range"""
+        where, params = _time_range("timestamp", since, until)
+        rows = self.conn.execute(
+            f"SELECT url, timestamp FROM sshx_urls {where} ORDER BY timestamp",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def record_restart(self, reason: str):
+        """Record a restart event"""
+        super().record_restart(reason)
+        self.conn.execute(
+            "INSERT INTO restarts (reason, timestamp) VALUES (?, ?)",
+            (reason, utc_timestamp(self.state["last_restart_time"]))
+        )
+        self._commit()
+    
+    def get_restart_history(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get restart events in an ISO timestamp range"""
+        where, params = _time_range("timestamp", since, until)
+        rows = self.conn.execute(
+            f"SELECT reason, timestamp FROM restarts {where} ORDER BY timestamp",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def record_run(self, repo: str, run: Dict[str, Any]):
+        """Record or update an observed workflow run"""
+        self.conn.execute(
+            "INSERT INTO workflow_runs (run_id, repo, run_number, status, conclusion, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(run_id) DO UPDATE SET status = excluded.status, "
+            "conclusion = excluded.conclusion, updated_at = excluded.updated_at",
+            (run["id"], repo, run.get("run_number"), run.get("status"), run.get("conclusion"),
+             utc_timestamp(run["created_at"]) if run.get("created_at") else None, run.get("updated_at"))
+        )
+        self._commit()
+    
+    def get_run(self, run_id: int) -> Optional[Dict[str, Any]]:
+        """Get a recorded workflow run"""
+        row = self.conn.execute(
+            "SELECT * FROM workflow_runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        return dict(row) if row else None
+    
+    def get_run_history(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Get recorded workflow runs created in an ISO timestamp range"""
+        where, params = _time_range("created_at", since, until)
+        rows = self.conn.execute(
+            f"SELECT * FROM workflow_runs {where} ORDER BY created_at",
+            params
+        ).fetchall()
+        return [dict(row) for row in rows]
+    
+    def get_full_state(self) -> Dict[str, Any]:
+        """Get full state (excluding sensitive data)"""
+        state_copy = super().get_full_state()
+        state_copy["sshx_urls"] = self.get_sshx_history(limit=20)
+        return state_copy
@@ -0,0 +1,70 @@
+"""
+Shared fixtures: the app modules live in the repository root, and GitHub is
+served offline by fake_github.FakeGitHub.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import github  # noqa: E402
+from fake_github import FakeGitHub  # noqa: E402
+from monitor import Monitor  # noqa: E402
+from storage import Storage  # noqa: E402
+
+
+REPO = "fake-user/vm"
+
+
+@pytest.fixture
+def fake():
+    """A FakeGitHub behind the shared HTTP client, with GitHub state reset"""
+    fake = FakeGitHub(repos=[REPO])
+    github.open_http_client(transport=fake.transport)
+    github.circuit_breaker.record_success()
+    github._metadata_cache.clear()
+    yield fake
+    asyncio.run(github.close_http_client())
+    github.circuit_breaker.record_success()
+    github._metadata_cache.clear()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    """Retry immediately instead of sleeping between attempts"""
+    async def backoff(attempt: int):
+        pass
+    monkeypatch.setattr(github.GitHubAPI, "_backoff", staticmethod(backoff))
+
+
+@pytest.fixture
+def storage(tmp_path):
+    """JSON state with one account, whose active repository is REPO"""
+    storage = Storage(str(tmp_path / "state.json"))
+    storage.add_github_token("monitor-test", "ghp_monitor")
+    storage.set_active_repo(REPO)
+    return storage
+
+
+@pytest.fixture
+def quick_dispatch(monkeypatch):
+    """Give up looking for a dispatched run after half a second"""
+    trigger_workflow = github.GitHubAPI.trigger_workflow
+    
+    async def trigger(self, repo, workflow_id="vm-worker.yml", timeout=30.0, correlation_id=None):
+        return await trigger_workflow(self, repo, workflow_id, 0.5, correlation_id)
+    monkeypatch.setattr(github.GitHubAPI, "trigger_workflow", trigger)
+
+
+@pytest.fixture
+def app(tmp_path, storage, monkeypatch):
+    """The FastAPI module (skipped without its dependencies) on the storage fixture"""
+    monkeypatch.setenv("STATE_FILE", str(tmp_path / "state.json"))
+    main = pytest.importorskip("main")
+    monkeypatch.setattr(main, "storage", storage)
+    monkeypatch.setattr(main, "monitor", Monitor(storage))
+    monkeypatch.setattr(main, "bot", None)
+    return main
@@ -0,0 +1,308 @@
+"""GitHubAPI against the offline FakeGitHub"""
+import asyncio
+import time
+
+import pytest
+
+import github
+from github import GitHubAPI, CircuitBreaker, GitHubUnavailable, CircuitOpenError, git_blob_sha
+
+from conftest import REPO
+
+
+def test_retries_server_errors(fake, no_backoff):
+    api = GitHubAPI("ghp_retry")
+    fake.fail_next(2, status=502)
+    
+    runs = asyncio.run(api.list_workflow_runs(REPO))
+    
+    assert runs == []
+    assert fake.request_count == 3
+    assert github.circuit_breaker.state == "closed"
+
+
+def test_gives_up_after_retries_and_opens_circuit(fake, no_backoff):
+    api = GitHubAPI("ghp_outage")
+    fake.outage(60)
+    
+    async def scenario():
+        for _ in range(github.circuit_breaker.failure_threshold):
+            with pytest.raises(GitHubUnavailable):
+                await api._request("GET", "/user")
+        sent = fake.request_count
+        with pytest.raises(CircuitOpenError):
+            await api._request("GET", "/user")
+        return sent
+    
+    sent = asyncio.run(scenario())
+    assert sent == github.circuit_breaker.failure_threshold * 4
+    assert fake.request_count == sent  # failed fast without a request
+    assert github.circuit_breaker.state == "open"
+
+
+def test_circuit_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow_request()
+    
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # one trial at a time
+    breaker.record_failure()  # failed trial reopens
+    assert breaker.state == "open"
+    
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    breaker.record_success()  # successful trial closes
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_half_open_circuit_sends_a_single_probe(fake):
+    api = GitHubAPI("ghp_probe")
+    fake.latency = 0.05
+    breaker = github.circuit_breaker
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    breaker.opened_at -= breaker.reset_timeout
+    
+    async def call(i: int):
+        try:
+            # Distinct URLs, so the requests are not shared
+            return (await api._request("GET", "/user", params={"n": i})).status_code
+        except CircuitOpenError:
+            return "rejected"
+    
+    async def scenario():
+        return await asyncio.gather(*(call(i) for i in range(3)))
+    
+    results = asyncio.run(scenario())
+    assert sorted(results, key=str) == [200, "rejected", "rejected"]
+    assert fake.request_count == 1
+    assert breaker.state == "closed"
+
+
+def test_conditional_get_reuses_cached_response(fake):
+    api = GitHubAPI("ghp_etag")
+    fake.add_run(REPO, started_ago=60)
+    
+    async def scenario():
+        first = await api.list_workflow_runs(REPO)
+        remaining = fake.remaining[api.headers["Authorization"]]
+        second = await api.list_workflow_runs(REPO)
+        return first, second, remaining
+    
+    first, second, remaining = asyncio.run(scenario())
+    assert first == second
+    assert fake.request_count == 2
+    # The 304 did not count against the rate limit
+    assert fake.remaining[api.headers["Authorization"]] == remaining
+
+
+def test_concurrent_identical_gets_share_one_request(fake):
+    api = GitHubAPI("ghp_shared")
+    fake.latency = 0.05
+    
+    async def background_list():
+        github.request_priority.set(github.PRIORITY_BACKGROUND)
+        return await api.list_workflow_runs(REPO)
+    
+    async def scenario():
+        return await asyncio.gather(
+            api.list_workflow_runs(REPO),
+            api.list_workflow_runs(REPO),
+            background_list()
+        )
+    
+    results = asyncio.run(scenario())
+    assert results == [[], [], []]
+    # The user calls share one request; the background call has its own
+    assert fake.request_count == 2
+
+
+def test_token_pool_only_serves_background_reads(fake):
+    api = GitHubAPI("ghp_own")
+    assert asyncio.run(api.enable_token_pool(REPO, {"other": "ghp_other"}))
+    api.rate_limit.remaining = 100  # less budget left than the unused pooled token
+    api.rate_limit.reset_at = time.time() + 3600
+    path = f"/repos/{REPO}/actions/runs"
+    
+    assert api._route("GET", path) is api
+    priority = github.request_priority.set(github.PRIORITY_BACKGROUND)
+    try:
+        assert api._route("GET", path).token == "ghp_other"
+        assert api._route("POST", path) is api
+    finally:
+        github.request_priority.reset(priority)
+
+
+def _age_metadata(api: GitHubAPI, endpoint: str, params: tuple, seconds: float):
+    key = (api.token, endpoint, params)
+    stored_at, value, negative = github._metadata_cache[key]
+    github._metadata_cache[key] = (stored_at - seconds, value, negative)
+
+
+def test_metadata_served_fresh_then_revalidated(fake):
+    api = GitHubAPI("ghp_swr")
+    ttl, stale_ttl = github.METADATA_TTLS["check_repository_exists"]
+    
+    async def scenario():
+        assert await api.check_repository_exists(REPO)
+        assert await api.check_repository_exists(REPO)
+        assert fake.request_count == 1  # fresh entry
+        
+        fake.repos.discard(REPO)
+        _age_metadata(api, "check_repository_exists", (REPO,), ttl + 1)
+        # Stale: the old answer is served while a background check runs
+        assert await api.check_repository_exists(REPO)
+        await asyncio.sleep(0.01)
+        # The definitive 404 replaced it, and is itself cached
+        assert not await api.check_repository_exists(REPO)
+        assert not await api.check_repository_exists(REPO)
+        return fake.request_count
+    
+    assert asyncio.run(scenario()) == 2
+
+
+def test_metadata_expires_after_stale_window(fake):
+    api = GitHubAPI("ghp_expired")
+    ttl, stale_ttl = github.METADATA_TTLS["check_repository_exists"]
+    
+    async def scenario():
+        assert await api.check_repository_exists(REPO)
+        fake.repos.discard(REPO)
+        _age_metadata(api, "check_repository_exists", (REPO,), ttl + stale_ttl + 1)
+        return await api.check_repository_exists(REPO)
+    
+    assert asyncio.run(scenario()) is False
+    assert fake.request_count == 2
+
+
+def test_failed_revalidation_evicts_entry(fake, no_backoff):
+    api = GitHubAPI("ghp_evict")
+    ttl, _ = github.METADATA_TTLS["validate_token"]
+    
+    async def scenario():
+        assert await api.validate_token() == (True, fake.login)
+        _age_metadata(api, "validate_token", (), ttl + 1)
+        fake.fail_next(4, status=503)
+        assert await api.validate_token() == (True, fake.login)
+        await asyncio.sleep(0.01)
+    
+    asyncio.run(scenario())
+    assert (api.token, "validate_token", ()) not in github._metadata_cache
+
+
+def test_pagination_follows_link_headers(fake):
+    api = GitHubAPI("ghp_pages")
+    for i in range(5):
+        fake.repos.add(f"{fake.login}/repo{i}")
+    
+    repos = asyncio.run(api.list_repositories(fake.login))
+    
+    assert len(repos) == 6
+    assert len({repo["full_name"] for repo in repos}) == 6
+    
+    fake.requests.clear()
+    limited = asyncio.run(GitHubAPI("ghp_pages_limit")._list_repositories(fake.login, 2))
+    assert len(limited[0]) == 2
+    assert sum(fake.requests.values()) == 1
+
+
+def test_iter_repositories_pages(fake):
+    api = GitHubAPI("ghp_iter")
+    for i in range(4):
+        fake.repos.add(f"{fake.login}/repo{i}")
+    
+    async def collect():
+        return [repo async for repo in api.iter_repositories(fake.login, per_page=2)]
+    
+    assert len(asyncio.run(collect())) == 5
+    assert fake.requests["GET /users/([^/]+)/repos"] == 3
+
+
+def test_iter_repositories_stops_fetching_at_limit(fake):
+    api = GitHubAPI("ghp_iter_limit")
+    for i in range(8):
+        fake.repos.add(f"{fake.login}/repo{i}")
+    
+    async def collect():
+        return [repo async for repo in api.iter_repositories(fake.login, per_page=2, limit=3)]
+    
+    assert len(asyncio.run(collect())) == 3
+    assert fake.requests["GET /users/([^/]+)/repos"] == 2
+
+
+def test_sync_files_without_changes_makes_no_commit(fake):
+    api = GitHubAPI("ghp_sync_noop")
+    workflow = "name: VM Worker\n"
+    fake.files[(REPO, ".github/workflows/vm-worker.yml")] = workflow.encode()
+    head = fake._head(REPO)
+    
+    results = asyncio.run(api.sync_files(REPO, {".github/workflows/vm-worker.yml": workflow}, "Sync"))
+    
+    assert results == {".github/workflows/vm-worker.yml": "unchanged"}
+    assert fake.heads[REPO] == head
+    assert not any(route.startswith(("POST", "PATCH")) for route in fake.requests)
+
+
+def test_sync_files_writes_changes_in_one_commit(fake):
+    api = GitHubAPI("ghp_sync_write")
+    fake.files[(REPO, "a.yml")] = b"old\n"
+    fake.files[(REPO, "b.yml")] = b"same\n"
+    head = fake._head(REPO)
+    
+    results = asyncio.run(api.sync_files(REPO, {"a.yml": "new\n", "b.yml": "same\n", "c.yml": "added\n"}, "Sync"))
+    
+    assert results == {"a.yml": "updated", "b.yml": "unchanged", "c.yml": "created"}
+    assert fake.commits[fake.heads[REPO]]["parents"] == [head]
+    assert fake.files[(REPO, "a.yml")] == b"new\n"
+    assert git_blob_sha(fake.files[(REPO, "c.yml")]) == git_blob_sha(b"added\n")
+
+
+def test_sync_files_refuses_to_overwrite_concurrent_push(fake):
+    api = GitHubAPI("ghp_sync_race")
+    fake._head(REPO)
+    original = fake._create_commit
+    
+    def create_commit_after_push(request, repo):
+        # Someone pushes between our ref read and our ref update
+        fake.files[(REPO, "other.txt")] = b"theirs\n"
+        fake._commit_files(REPO, "Concurrent push")
+        return original(request, repo)
+    
+    fake._routes = [
+        (method, pattern, create_commit_after_push if handler == original else handler)
+        for method, pattern, handler in fake._routes
+    ]
+    
+    assert asyncio.run(api.sync_files(REPO, {"a.yml": "mine\n"}, "Sync")) is None
+    assert fake.files[(REPO, "other.txt")] == b"theirs\n"
+
+
+def test_dispatch_finds_run_by_correlation_id(fake):
+    api = GitHubAPI("ghp_dispatch")
+    fake.dispatch_delay = 0.2
+    
+    async def scenario():
+        dispatch = asyncio.create_task(api.trigger_workflow(REPO, timeout=5))
+        await asyncio.sleep(0.05)
+        # Another run created right after ours is newer, but not ours
+        other = fake.add_run(REPO)
+        other.started -= fake.dispatch_delay
+        return await dispatch, other
+    
+    (success, run_id), other = asyncio.run(scenario())
+    assert success
+    assert run_id is not None and run_id != other.id
+    assert fake.runs[run_id].display_title.startswith("VM Worker ")
+    assert fake.runs[run_id].display_title != "VM Worker"
+
+
+def test_dispatch_without_visible_run_times_out(fake):
+    api = GitHubAPI("ghp_dispatch_timeout")
+    fake.dispatch_delay = 60
+    
+    assert asyncio.run(api.trigger_workflow(REPO, timeout=1)) == (True, None)
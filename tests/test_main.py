@@ -0,0 +1,31 @@
+"""Application wiring in main.py"""
+import asyncio
+
+import pytest
+
+
+def test_start_bot_builds_the_notification_bot(app, monkeypatch):
+    pytest.importorskip("telegram")
+    from bot_notification import TelegramBot
+    
+    async def run(self):
+        pass
+    monkeypatch.setattr(TelegramBot, "run", run)
+    monkeypatch.setenv("TELEGRAM_BOT_TOKEN", "123456:offline-test-token")
+    
+    asyncio.run(app.start_bot())
+    assert isinstance(app.bot, TelegramBot)
+    assert app.bot.storage is app.storage
+
+
+def test_dashboard_start_is_not_dispatched_again(app, fake, quick_dispatch):
+    from fastapi.testclient import TestClient
+    
+    fake.dispatch_delay = 60  # GitHub accepts the dispatch but lists the run late
+    headers = {"Authorization": f"Bearer {app.create_access_token({'sub': 'admin'})}"}
+    
+    response = TestClient(app.app).post("/api/workflow/start", headers=headers)
+    assert response.json() == {"success": True, "run_id": None, "message": "Workflow started successfully"}
+    
+    asyncio.run(app.monitor.tick())
+    assert len(fake.runs) == 1
@@ -0,0 +1,61 @@
+"""Monitor ticks against the offline FakeGitHub"""
+import asyncio
+
+from monitor import Monitor
+
+from conftest import REPO
+
+
+def test_unconfirmed_dispatch_is_not_repeated(fake, storage, quick_dispatch):
+    fake.dispatch_delay = 60  # GitHub accepts the dispatch but lists the run late
+    monitor = Monitor(storage, dispatch_grace=60)
+    
+    async def scenario():
+        await monitor.tick(force=True)
+        await monitor.tick(force=True)
+        assert len(fake.runs) == 1
+        
+        fake.dispatch_delay = 0
+        await monitor.tick(force=True)
+    
+    asyncio.run(scenario())
+    assert len(fake.runs) == 1
+    assert monitor.targets[("monitor-test", REPO)].pending_dispatch is None
+
+
+def test_dispatch_is_retried_after_grace_period(fake, storage, quick_dispatch):
+    fake.dispatch_delay = 60
+    monitor = Monitor(storage, dispatch_grace=0)
+    
+    async def scenario():
+        await monitor.tick(force=True)
+        await monitor.tick(force=True)
+    
+    asyncio.run(scenario())
+    assert len(fake.runs) == 2
+
+
+def test_known_sshx_url_skips_log_reads_after_restart(fake, storage):
+    fake.add_run(REPO, started_ago=60)
+    asyncio.run(Monitor(storage).tick(force=True))
+    assert storage.get_current_sshx_url() == "https://sshx.io/s/fake1000"
+    
+    fake.requests.clear()
+    asyncio.run(Monitor(storage).tick(force=True))
+    assert not any("logs" in route for route in fake.requests)
+
+
+def test_dispatch_survives_a_timed_out_check(fake, storage, quick_dispatch):
+    fake.dispatch_delay = 20  # the run is listed long after the check gives up
+    monitor = Monitor(storage, target_timeout=0.2)
+    
+    async def scenario():
+        await monitor.tick(force=True)
+        target = monitor.targets[("monitor-test", REPO)]
+        assert target.last_error.startswith("Check timed out")
+        await target.dispatch_task
+        await monitor.tick(force=True)
+    
+    asyncio.run(scenario())
+    assert len(fake.runs) == 1
+    assert storage.get_restart_info()["total_restarts"] == 1
@@ -0,0 +1,83 @@
+"""Storage engines: journal replay, torn-tail recovery and SQLite import"""
+import json
+
+from storage import JournalStorage, JOURNAL_SEQ_KEY
+from storage_sqlite import SQLiteStorage
+
+
+def test_journal_replays_records_after_snapshot(tmp_path):
+    path = str(tmp_path / "state.json")
+    storage = JournalStorage(path)
+    storage.set_active_repo("user/snapshot")
+    storage.compact()
+    storage.set_active_repo("user/journal")
+    storage.add_sshx_url("https://sshx.io/s/one")
+    storage.close()
+    
+    with open(path) as f:
+        assert json.load(f)["active_repo"] == "user/snapshot"
+    
+    reloaded = JournalStorage(path)
+    assert reloaded.get_active_repo() == "user/journal"
+    assert reloaded.get_current_sshx_url() == "https://sshx.io/s/one"
+    assert [entry["url"] for entry in reloaded.get_sshx_history()] == ["https://sshx.io/s/one"]
+
+
+def test_journal_skips_records_covered_by_snapshot(tmp_path):
+    path = str(tmp_path / "state.json")
+    storage = JournalStorage(path)
+    storage.increment_uptime(60)
+    storage.close()
+    # A snapshot written after the journal without truncating it (e.g. a
+    # crash between the two) must not apply the same records twice
+    storage = JournalStorage(path)
+    with open(storage.journal_path) as f:
+        journal = f.read()
+    storage.compact()
+    storage.close()
+    with open(storage.journal_path, "w") as f:
+        f.write(journal)
+    
+    assert JournalStorage(path).get_uptime() == 60
+
+
+def test_journal_recovers_from_torn_tail(tmp_path):
+    path = str(tmp_path / "state.json")
+    storage = JournalStorage(path)
+    storage.set_active_repo("user/kept")
+    storage.close()
+    with open(storage.journal_path, "a") as f:
+        f.write('{"set": {"active_repo": "user/to')
+    
+    reloaded = JournalStorage(path)
+    assert reloaded.get_active_repo() == "user/kept"
+    # The partial line is dropped, so new records start on a clean line
+    reloaded.set_active_repo("user/after")
+    reloaded.close()
+    with open(storage.journal_path) as f:
+        for line in f:
+            json.loads(line)
+    assert JournalStorage(path).get_active_repo() == "user/after"
+
+
+def test_sqlite_imports_json_state_with_journal(tmp_path):
+    json_path = str(tmp_path / "state.json")
+    legacy = JournalStorage(json_path)
+    legacy.set_active_repo("user/snapshot")
+    legacy.compact()
+    legacy.set_active_repo("user/journal")
+    legacy.close()
+    
+    storage = SQLiteStorage(str(tmp_path / "state.db"), import_from=json_path)
+    assert storage.get_active_repo() == "user/journal"
+    assert JOURNAL_SEQ_KEY not in storage.get_full_state()
+    storage.close()
+
+
+def test_sqlite_history_range_compares_in_utc(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "state.db"), import_from=None)
+    storage.record_run("user/repo", {"id": 1, "created_at": "2030-01-01T00:00:00Z"})
+    
+    assert len(storage.get_run_history(since="2030-01-01T01:00:00+02:00")) == 1
+    assert storage.get_run_history(since="2029-12-31T23:00:00-02:00") == []
+    storage.close()
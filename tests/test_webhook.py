@@ -0,0 +1,100 @@
+"""GitHub webhook endpoint and the monitor's handling of its events"""
+import hashlib
+import hmac
+import json
+
+import pytest
+
+from monitor import Monitor
+
+from conftest import REPO
+
+
+SECRET = "webhook-secret"
+
+
+def workflow_run_event(repo: str = REPO, path: str = ".github/workflows/vm-worker.yml") -> dict:
+    return {
+        "action": "completed",
+        "repository": {"full_name": repo},
+        "workflow_run": {
+            "id": 1000,
+            "path": path,
+            "status": "completed",
+            "conclusion": "success",
+            "display_title": "VM Worker",
+            "created_at": "2026-01-01T00:00:00Z",
+            "updated_at": "2026-01-01T00:10:00Z"
+        }
+    }
+
+
+def sign(body: bytes, secret: str = SECRET) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    from fastapi.testclient import TestClient
+    monkeypatch.setattr(app, "WEBHOOK_SECRET", SECRET)
+    return TestClient(app.app)
+
+
+def post(client, body: bytes, signature=None, event: str = "workflow_run"):
+    headers = {"X-GitHub-Event": event, "Content-Type": "application/json"}
+    if signature is not None:
+        headers["X-Hub-Signature-256"] = signature
+    return client.post("/api/github/webhook", content=body, headers=headers)
+
+
+def test_signed_event_wakes_the_monitor(client, app):
+    body = json.dumps(workflow_run_event()).encode()
+    response = post(client, body, sign(body))
+    assert response.status_code == 200
+    assert response.json() == {"success": True, "handled": True}
+    assert app.monitor._wake.is_set()
+
+
+@pytest.mark.parametrize("signature", [None, "sha256=" + "0" * 64, "md5=abc"])
+def test_bad_or_missing_signature_is_rejected(client, app, signature):
+    body = json.dumps(workflow_run_event()).encode()
+    assert post(client, body, signature).status_code == 401
+    assert not app.monitor._wake.is_set()
+
+
+def test_signature_with_another_secret_is_rejected(client):
+    body = json.dumps(workflow_run_event()).encode()
+    assert post(client, body, sign(body, "other-secret")).status_code == 401
+
+
+def test_webhooks_are_off_without_a_secret(client, app, monkeypatch):
+    monkeypatch.setattr(app, "WEBHOOK_SECRET", None)
+    body = json.dumps(workflow_run_event()).encode()
+    assert post(client, body, sign(body)).status_code == 404
+
+
+@pytest.mark.parametrize("body", [b"not json", json.dumps({"repository": {"full_name": REPO}}).encode()])
+def test_malformed_payload_is_rejected(client, body):
+    assert post(client, body, sign(body)).status_code == 400
+
+
+def test_events_for_other_repositories_are_ignored(storage):
+    monitor = Monitor(storage)
+    assert not monitor.handle_webhook("workflow_run", workflow_run_event(repo="someone-else/vm"))
+    assert not monitor._wake.is_set()
+
+
+def test_events_for_other_workflows_are_ignored(storage):
+    monitor = Monitor(storage)
+    event = workflow_run_event(path=".github/workflows/ci.yml")
+    assert not monitor.handle_webhook("workflow_run", event)
+    assert not monitor._wake.is_set()
+
+
+def test_event_for_the_monitored_workflow_schedules_a_check(storage):
+    monitor = Monitor(storage)
+    target = monitor._refresh_targets()[0]
+    target.next_check_at = float("inf")
+    assert monitor.handle_webhook("workflow_run", workflow_run_event(repo=REPO.upper()))
+    assert target.next_check_at == 0.0
+    assert monitor._wake.is_set()